@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+import httpx
+
+from app.slots import SlotPool
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class NoBackendError(Exception):
+    """Raised when no backend is configured."""
+
+
+class Backend:
+    """One llama.cpp server with its own slots."""
+
+    def __init__(self, url: str, num_slots: int = 0, residency: bool = True):
+        self.url = url
+        self.slot_pool = SlotPool(num_slots, residency=residency)
+        self.healthy = True
+        self.failures = 0  # Consecutive failed requests or health checks
+        self.last_error: Optional[str] = None
+        self.last_failure = 0.0  # Monotonic time of the last failure
+
+    def load(self) -> float:
+        """Leased and waiting requests per slot."""
+        pool = self.slot_pool
+        busy = sum(1 for slot in pool.slots if slot.busy)
+        return (busy + pool.waiting) / max(pool.num_slots, 1)
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "slots": self.slot_pool.stats(),
+        }
+
+
+class BackendPool:
+    """
+    Pool of llama.cpp servers sharing one session directory.
+
+    A key is routed to the backend that holds its session in a slot, so
+    resident KV caches are reused. Other keys, or keys whose backend is
+    unhealthy, go to the least loaded healthy backend; since the session
+    files are shared, any backend can restore them. Backends are marked
+    unhealthy after repeated failures and back healthy once a health check
+    succeeds. Without health checks nothing would mark them healthy again,
+    so backends are then never excluded; when every backend is unhealthy,
+    the one that failed least recently is used.
+    """
+
+    def __init__(self, urls: List[str], num_slots: int = 0, residency: bool = True,
+                 unhealthy_after: int = 1):
+        """
+        Args:
+            urls: Base URLs of the backends
+            num_slots: Slots to use per backend, 0 to detect from each backend
+            residency: Reuse sessions that are still loaded into a slot
+            unhealthy_after: Consecutive failures before a backend is taken out
+        """
+        self.backends = [Backend(url, num_slots, residency) for url in urls]
+        self.unhealthy_after = unhealthy_after
+        self.routed_sticky = 0
+        self.routed_least_loaded = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self.health_checks = False
+
+    async def start(self, client: httpx.AsyncClient, health_check_interval: float = 0):
+        """Start the slot pool of every backend and the periodic health checks."""
+        self._client = client
+        await asyncio.gather(*(
+            backend.slot_pool.start(client, backend.url) for backend in self.backends
+        ))
+        self.health_checks = health_check_interval > 0
+        if self.health_checks:
+            self._health_task = asyncio.create_task(self.health_loop(health_check_interval))
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+
+    def route(self, key: str) -> Backend:
+        """
+        Choose the backend for a request with key.
+
+        Raises:
+            NoBackendError: No backend is configured
+        """
+        if not self.backends:
+            raise NoBackendError("No backend configured")
+        usable = [backend for backend in self.backends if backend.healthy or not self.health_checks]
+        if not usable:
+            fallback = min(self.backends, key=lambda backend: backend.last_failure)
+            logger.warning(f"No healthy backend, trying {fallback.url} which failed least recently")
+            usable = [fallback]
+
+        for backend in usable:
+            if backend.slot_pool.holds(key):
+                self.routed_sticky += 1
+                return backend
+
+        self.routed_least_loaded += 1
+        return min(usable, key=lambda backend: backend.load())
+
+    def claim(self, key: str, backend: Backend):
+        """
+        Drop copies of the session for key left on other backends, once
+        their unsaved changes were saved or given up.
+        """
+        for other in self.backends:
+            if other is not backend and other.slot_pool.holds(key):
+                # The copy on backend is the current one now, the old copy must never be saved over it
+                other.slot_pool.forget(key)
+
+    def residency(self, key: str) -> List[tuple]:
+        """(backend, slot) pairs holding the session for key."""
+        return [
+            (backend, backend.slot_pool.resident_slot(key))
+            for backend in self.backends
+            if backend.slot_pool.holds(key)
+        ]
+
+    def forget(self, key: str):
+        """Drop the session for key from every slot."""
+        for backend in self.backends:
+            backend.slot_pool.forget(key)
+
+    def mark_success(self, backend: Backend):
+        backend.failures = 0
+        if not backend.healthy:
+            logger.info(f"Backend {backend.url} is healthy again")
+            backend.healthy = True
+
+    def mark_failure(self, backend: Backend, error: str):
+        backend.failures += 1
+        backend.last_error = error
+        backend.last_failure = time.monotonic()
+        if backend.healthy and backend.failures >= self.unhealthy_after:
+            logger.warning(f"Marking backend {backend.url} unhealthy: {error}")
+            backend.healthy = False
+
+    async def check(self, backend: Backend):
+        """Probe the llama.cpp /health endpoint of a backend."""
+        try:
+            response = await self._client.get(f"{backend.url}/health")
+            if response.status_code == 200:
+                self.mark_success(backend)
+            else:
+                self.mark_failure(backend, f"/health returned {response.status_code}")
+        except Exception as e:
+            self.mark_failure(backend, f"/health failed: {str(e)}")
+
+    async def health_loop(self, interval: float):
+        """Periodically health-check every backend."""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.gather(*(self.check(backend) for backend in self.backends))
+
+    def dirty_slots(self) -> List[tuple]:
+        """(backend, slot) pairs of idle slots holding unsaved sessions."""
+        return [
+            (backend, slot)
+            for backend in self.backends
+            for slot in backend.slot_pool.dirty_slots()
+        ]
+
+    def stats(self) -> dict:
+        """Routing counters and per-backend health and slot statistics."""
+        return {
+            "routed_sticky": self.routed_sticky,
+            "routed_least_loaded": self.routed_least_loaded,
+            "backends": [backend.stats() for backend in self.backends],
+        }
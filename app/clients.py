@@ -0,0 +1,154 @@
+import logging
+from typing import Optional
+
+import httpx
+
+from app.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Response body stream that reports when it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close()
+
+
+class PoolMonitorTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper that counts requests in flight, from sending the
+    request until the response body is closed, to show pool saturation.
+    """
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport):
+        self._transport = transport
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    def _done(self):
+        self.in_flight -= 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        self.requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.in_flight -= 1
+            self.errors += 1
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, self._done),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    def connections(self) -> dict:
+        """Open and idle connections of the underlying pool, if it can be inspected."""
+        pool = getattr(self._transport, "_pool", None)
+        if pool is None:
+            return {}
+        connections = pool.connections
+        return {
+            "open": len(connections),
+            "idle": sum(1 for connection in connections if connection.is_idle()),
+        }
+
+
+class BackendClient:
+    """
+    Shared HTTP client for the original server.
+
+    Created in the FastAPI lifespan with pooled keep-alive connections sized
+    by the settings (optionally HTTP/2), closed gracefully on shutdown.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._transport: Optional[PoolMonitorTransport] = None
+        self.http2 = False
+
+    def start(self):
+        """Create the pooled client."""
+        self.http2 = settings.backend_http2
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+                self.http2 = False
+
+        limits = httpx.Limits(
+            max_connections=settings.backend_max_connections,
+            max_keepalive_connections=settings.backend_max_keepalive_connections,
+            keepalive_expiry=settings.backend_keepalive_expiry,
+        )
+        self._transport = PoolMonitorTransport(
+            httpx.AsyncHTTPTransport(limits=limits, http2=self.http2)
+        )
+        self._client = httpx.AsyncClient(
+            transport=self._transport,
+            timeout=httpx.Timeout(
+                settings.original_server_timeout,
+                connect=settings.original_server_connect_timeout,
+            ),
+        )
+        logger.info(
+            f"Backend client started: max_connections={settings.backend_max_connections}, "
+            f"max_keepalive={settings.backend_max_keepalive_connections}, http2={self.http2}"
+        )
+
+    async def close(self):
+        """Close all pooled connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("Backend client is not started")
+        return self._client
+
+    def stats(self) -> dict:
+        """Pool usage, to size the pool against the backend slot count."""
+        if self._transport is None:
+            return {}
+        max_connections = settings.backend_max_connections
+        return {
+            "http2": self.http2,
+            "max_connections": max_connections,
+            "in_flight": self._transport.in_flight,
+            "peak_in_flight": self._transport.peak_in_flight,
+            "saturation": self._transport.in_flight / max_connections if max_connections else 0.0,
+            "requests": self._transport.requests,
+            "errors": self._transport.errors,
+            "connections": self._transport.connections(),
+        }
+
+
+# Shared client for every request to the original server
+backend_client = BackendClient()
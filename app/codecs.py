@@ -0,0 +1,117 @@
+import gzip
+import logging
+import shutil
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Copy buffer for streaming (de)compression of large session files
+CHUNK_SIZE = 1 << 20
+
+
+class Codec:
+    """Streaming file compression for cold session snapshots."""
+
+    name = ""
+    suffix = ""
+
+    def compress_file(self, src: str, dst: str):
+        raise NotImplementedError
+
+    def decompress_file(self, src: str, dst: str):
+        raise NotImplementedError
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    suffix = ".zst"
+
+    def __init__(self, level: int = 3):
+        import zstandard
+        self._zstandard = zstandard
+        self.level = level
+
+    def compress_file(self, src: str, dst: str):
+        compressor = self._zstandard.ZstdCompressor(level=self.level, threads=-1)
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            compressor.copy_stream(fin, fout, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+
+    def decompress_file(self, src: str, dst: str):
+        decompressor = self._zstandard.ZstdDecompressor()
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            decompressor.copy_stream(fin, fout, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+
+
+class Lz4Codec(Codec):
+    name = "lz4"
+    suffix = ".lz4"
+
+    def __init__(self, level: int = 0):
+        import lz4.frame
+        self._frame = lz4.frame
+        self.level = level
+
+    def compress_file(self, src: str, dst: str):
+        with open(src, "rb") as fin, self._frame.open(dst, "wb", compression_level=self.level) as fout:
+            shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+
+    def decompress_file(self, src: str, dst: str):
+        with self._frame.open(src, "rb") as fin, open(dst, "wb") as fout:
+            shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+
+
+class GzipCodec(Codec):
+    """Standard library fallback, slower than zstd and lz4."""
+
+    name = "gzip"
+    suffix = ".gz"
+
+    def __init__(self, level: int = 1):
+        self.level = level
+
+    def compress_file(self, src: str, dst: str):
+        with open(src, "rb") as fin, gzip.open(dst, "wb", compresslevel=self.level) as fout:
+            shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+
+    def decompress_file(self, src: str, dst: str):
+        with gzip.open(src, "rb") as fin, open(dst, "wb") as fout:
+            shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+
+
+CODECS = {
+    "zstd": ZstdCodec,
+    "lz4": Lz4Codec,
+    "gzip": GzipCodec,
+}
+
+
+def get_codec(name: str) -> Codec:
+    """
+    Create the codec called name, falling back to gzip if its package
+    (zstandard or lz4) is not installed.
+
+    Raises:
+        ValueError: Unknown codec name
+    """
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression codec: {name} (expected one of {', '.join(CODECS)})")
+    try:
+        return CODECS[name]()
+    except ImportError:
+        logger.warning(f"Compression codec {name} is not installed, using gzip")
+        return GzipCodec()
+
+
+def codec_for_suffix(suffix: str) -> Codec:
+    """
+    Create the codec that reads files with suffix, e.g. ones written before
+    SESSION_COMPRESSION changed.
+
+    Raises:
+        ValueError: Unknown suffix
+        ImportError: The codec's package is not installed
+    """
+    for codec_class in CODECS.values():
+        if codec_class.suffix == suffix:
+            return codec_class()
+    raise ValueError(f"Unknown compressed file suffix: {suffix}")
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.git import repo_id
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class CommitCache:
+    """
+    Content-addressed cache of rendered commits (the output of git show).
+
+    Commits never change once they exist, so entries keyed by (repo, commit
+    hash) never go stale. The memory tier is an LRU bounded by total size;
+    the optional disk tier keeps one file per commit and survives restarts.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0):
+        """
+        Args:
+            max_bytes: Size limit of the memory tier (characters of commit text)
+            disk_dir: Directory of the disk tier, None to keep commits in memory only
+            disk_max_bytes: Size limit of the disk tier, 0 for no limit
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_sizes: Optional[Dict[str, int]] = None  # Loaded on first disk write
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def get_many(self, repo_path: str, hashes: Iterable[str]) -> Dict[str, str]:
+        """
+        Look up rendered commits.
+
+        Returns:
+            Mapping of commit hash to content for the commits found in the cache
+        """
+        repo = repo_id(repo_path)
+        found = {}
+        missing = []
+        for commit_hash in hashes:
+            content = self._memory.get((repo, commit_hash))
+            if content is not None:
+                self._memory.move_to_end((repo, commit_hash))
+                found[commit_hash] = content
+                self.memory_hits += 1
+            else:
+                missing.append(commit_hash)
+
+        if missing and self.disk_dir:
+            from_disk = await asyncio.to_thread(self._read_disk, repo, missing)
+            for commit_hash, content in from_disk.items():
+                found[commit_hash] = content
+                self._remember(repo, commit_hash, content)
+            self.disk_hits += len(from_disk)
+            missing = [h for h in missing if h not in from_disk]
+
+        self.misses += len(missing)
+        return found
+
+    async def put_many(self, repo_path: str, commits: List[Tuple[str, str]]):
+        """Store rendered commits given as (hash, content) tuples."""
+        repo = repo_id(repo_path)
+        for commit_hash, content in commits:
+            self._remember(repo, commit_hash, content)
+        if commits and self.disk_dir:
+            await asyncio.to_thread(self._write_disk, repo, commits)
+
+    def _remember(self, repo: str, commit_hash: str, content: str):
+        key = (repo, commit_hash)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        if len(content) > self.max_bytes:
+            return
+        self._memory[key] = content
+        self._memory_bytes += len(content)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _disk_path(self, repo: str, commit_hash: str) -> str:
+        repo_dir = hashlib.sha256(repo.encode()).hexdigest()[:16]
+        return os.path.join(self.disk_dir, repo_dir, commit_hash[:2], f"{commit_hash}.txt")
+
+    def _load_disk_sizes(self):
+        if self._disk_sizes is not None:
+            return
+        sizes = {}
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    sizes[path] = os.path.getsize(path)
+                except OSError:
+                    pass
+        self._disk_sizes = sizes
+        self._disk_bytes = sum(sizes.values())
+
+    def _read_disk(self, repo: str, hashes: List[str]) -> Dict[str, str]:
+        found = {}
+        for commit_hash in hashes:
+            path = self._disk_path(repo, commit_hash)
+            try:
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    found[commit_hash] = f.read()
+                # Access time for LRU eviction of the disk tier
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Error reading cached commit {commit_hash}: {str(e)}")
+        return found
+
+    def _write_disk(self, repo: str, commits: List[Tuple[str, str]]):
+        with self._disk_lock:
+            self._load_disk_sizes()
+            for commit_hash, content in commits:
+                self._write_disk_file(repo, commit_hash, content)
+            if self.disk_max_bytes and self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _write_disk_file(self, repo: str, commit_hash: str, content: str):
+        path = self._disk_path(repo, commit_hash)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+            self._disk_bytes += size - self._disk_sizes.get(path, 0)
+            self._disk_sizes[path] = size
+        except OSError as e:
+            logger.warning(f"Error caching commit {commit_hash} on disk: {str(e)}")
+
+    def _evict_disk(self):
+        """Remove least recently used files until the disk tier is 90% full."""
+        def mtime(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0.0
+
+        for path in sorted(self._disk_sizes, key=mtime):
+            if self._disk_bytes <= self.disk_max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._disk_bytes -= self._disk_sizes.pop(path)
+
+    def stats(self) -> dict:
+        """Cache sizes and hit counters."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_max_bytes": self.max_bytes,
+            "disk_entries": len(self._disk_sizes) if self._disk_sizes is not None else None,
+            "disk_bytes": self._disk_bytes if self._disk_sizes is not None else None,
+            "disk_max_bytes": self.disk_max_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+# Shared cache of rendered commits for /git/history
+commit_cache = CommitCache(
+    settings.commit_cache_max_bytes,
+    settings.commit_cache_dir or None,
+    settings.commit_cache_disk_max_bytes,
+)
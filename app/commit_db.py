@@ -0,0 +1,468 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.git import KeyedLocks, render_commits, repo_id, run_git
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Commits rendered and stored at a time while indexing
+STORE_BATCH_SIZE = 200
+
+# Field and record separators of the metadata format
+FIELD_SEP = "\x1f"
+RECORD_SEP = "\x1e"
+METADATA_FORMAT = f"--format={RECORD_SEP}%H{FIELD_SEP}%an{FIELD_SEP}%ae{FIELD_SEP}%at{FIELD_SEP}%s"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repos (
+    repo TEXT PRIMARY KEY,
+    head TEXT,
+    total_commits INTEGER NOT NULL DEFAULT 0,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS commits (
+    repo TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    author TEXT,
+    email TEXT,
+    date INTEGER,
+    subject TEXT,
+    files TEXT,
+    insertions INTEGER,
+    deletions INTEGER,
+    content TEXT NOT NULL,
+    PRIMARY KEY (repo, hash)
+);
+CREATE TABLE IF NOT EXISTS history (
+    repo TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (repo, seq)
+);
+"""
+
+
+def _read_file(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def read_head(repo_path: str) -> Optional[str]:
+    """
+    Commit hash of HEAD read from the repository files, without running git.
+
+    Handles .git files (worktrees, submodules), bare repositories and packed
+    refs. Returns None when HEAD cannot be resolved this way.
+    """
+    git_dir = os.path.join(repo_path, ".git")
+    if os.path.isfile(git_dir):
+        pointer = _read_file(git_dir) or ""
+        if not pointer.startswith("gitdir: "):
+            return None
+        git_dir = os.path.join(repo_path, pointer[len("gitdir: "):])
+    elif not os.path.isdir(git_dir):
+        git_dir = repo_path  # Bare repository
+
+    head = _read_file(os.path.join(git_dir, "HEAD"))
+    if head is None:
+        return None
+    if not head.startswith("ref: "):
+        return head
+    ref = head[len("ref: "):]
+
+    common = _read_file(os.path.join(git_dir, "commondir"))
+    common_dir = os.path.join(git_dir, common) if common else git_dir
+    for base in (git_dir, common_dir):
+        value = _read_file(os.path.join(base, ref))
+        if value:
+            return value
+    packed = _read_file(os.path.join(common_dir, "packed-refs")) or ""
+    for line in packed.split("\n"):
+        parts = line.split(" ", 1)
+        if len(parts) == 2 and parts[1] == ref:
+            return parts[0]
+    return None
+
+
+def parse_metadata(output: str) -> Dict[str, dict]:
+    """
+    Parse `git log --numstat` output in METADATA_FORMAT.
+
+    Returns:
+        Mapping of commit hash to author, email, date, subject, files,
+        insertions and deletions
+    """
+    commits = {}
+    for record in output.split(RECORD_SEP)[1:]:
+        header, _, numstat = record.partition("\n")
+        fields = header.split(FIELD_SEP)
+        if len(fields) < 5:
+            continue
+        commit_hash, author, email, date, subject = fields[:5]
+        files = []
+        insertions = deletions = 0
+        for line in numstat.split("\n"):
+            parts = line.split("\t", 2)
+            if len(parts) != 3:
+                continue
+            added, removed, path = parts
+            # Binary files show "-" instead of line counts
+            added = int(added) if added.isdigit() else 0
+            removed = int(removed) if removed.isdigit() else 0
+            files.append({"path": path, "insertions": added, "deletions": removed})
+            insertions += added
+            deletions += removed
+        commits[commit_hash] = {
+            "author": author,
+            "email": email,
+            "date": int(date) if date.isdigit() else None,
+            "subject": subject,
+            "files": files,
+            "insertions": insertions,
+            "deletions": deletions,
+        }
+    return commits
+
+
+class CommitDatabase:
+    """
+    sqlite database of the commits of registered repositories.
+
+    Stores the rendered commit (what `git show` prints) with its author,
+    date, subject and per-file stat, plus the order of the last max_commits
+    commits reachable from HEAD. A background task refreshes every
+    registered repository: when HEAD moved forward only the `old..new`
+    range is rendered; the new commits are put on top of the stored order
+    for a linear range, and when the range contains merges (whose commits
+    `git log` interleaves by date) or the old HEAD is no longer an ancestor
+    (force push, rebase) the order is rebuilt from the new HEAD, reusing the
+    commits already stored. Requests then read commit lists and contents
+    from the database, and only check HEAD by reading the repository files.
+    A request for a repository that is not indexed yet, or whose HEAD moved,
+    starts a refresh in the background and is answered with git meanwhile.
+    """
+
+    def __init__(self, path: Optional[str], max_commits: int = 10000):
+        """
+        Args:
+            path: sqlite database file, None to disable the database
+            max_commits: Most recent commits of a repository kept in the database
+        """
+        self.path = path
+        self.max_commits = max_commits
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._lock = KeyedLocks()  # Per repository
+        self._heads: Dict[str, Optional[str]] = {}  # Indexed HEAD per registered repository
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refreshing: Dict[str, asyncio.Task] = {}  # Refreshes started by requests
+        self.hits = 0
+        self.refreshes = 0
+        self.rebuilds = 0
+        self.commits_stored = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    async def start(self, repos: List[str], refresh_interval: float = 30.0):
+        """
+        Open the database, register repositories and start the background refresh.
+
+        Args:
+            repos: Repositories to index in the background
+            refresh_interval: Seconds between checks for new commits
+        """
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self._open)
+        for repo_path in repos:
+            self._heads.setdefault(repo_id(repo_path), None)
+        if refresh_interval > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(refresh_interval))
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+        for task in list(self._refreshing.values()):
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.close()
+            self._conn = None
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        for repo, head in conn.execute("SELECT repo, head FROM repos"):
+            self._heads[repo] = head
+        self._conn = conn
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            for repo in list(self._heads):
+                try:
+                    await self.refresh(repo)
+                except Exception as e:
+                    logger.error(f"Error indexing commits of {repo}: {str(e)}")
+            await asyncio.sleep(interval)
+
+    async def _is_ancestor(self, repo: str, old: str, new: str) -> bool:
+        try:
+            await run_git(repo, "merge-base", "--is-ancestor", old, new)
+            return True
+        except subprocess.CalledProcessError:
+            # Exit status 1: not an ancestor, 128: old commit no longer exists
+            return False
+
+    async def refresh(self, repo_path: str, head: Optional[str] = None):
+        """
+        Bring the database up to date with HEAD of a repository.
+
+        Args:
+            repo_path: Path to the git repository
+            head: Current HEAD if already known
+        """
+        repo = repo_id(repo_path)
+        async with self._lock(repo):
+            if head is None:
+                head = (await run_git(repo, "rev-parse", "HEAD")).strip()
+            old = self._heads.get(repo)
+            if old == head:
+                return
+            start = time.perf_counter()
+
+            rebuild = True
+            if old and await self._is_ancestor(repo, old, head):
+                output = await run_git(
+                    repo, "rev-list", "--parents", f"--max-count={self.max_commits}", f"{old}..{head}"
+                )
+                lines = [line.split() for line in output.split("\n") if line]
+                new_hashes = [line[0] for line in lines]
+                # Without merges the new commits come before the old ones in `git log`;
+                # merged branches interleave by date, so the order is rebuilt then
+                rebuild = any(len(line) > 2 for line in lines)
+            elif old:
+                logger.info(f"History of {repo} was rewritten, rebuilding the commit order")
+                self.rebuilds += 1
+            if rebuild:
+                output = await run_git(repo, "rev-list", f"--max-count={self.max_commits}", head)
+                new_hashes = [h for h in output.split("\n") if h]
+            total = int((await run_git(repo, "rev-list", "--count", head)).strip())
+
+            await self._store_commits(repo, new_hashes)
+            await asyncio.to_thread(self._update_history, repo, head, new_hashes, rebuild, total)
+            self._heads[repo] = head
+            self.refreshes += 1
+            logger.info(
+                f"Indexed {len(new_hashes)} commits of {repo} up to {head[:8]} "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+
+    async def _store_commits(self, repo: str, commit_hashes: List[str]):
+        """Render and store the commits that are not in the database yet."""
+        stored = set()
+        for start in range(0, len(commit_hashes), STORE_BATCH_SIZE):
+            batch = commit_hashes[start:start + STORE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = await asyncio.to_thread(
+                self._query, f"SELECT hash FROM commits WHERE repo = ? AND hash IN ({placeholders})", (repo, *batch)
+            )
+            stored.update(row[0] for row in rows)
+        missing = [h for h in commit_hashes if h not in stored]
+
+        for start in range(0, len(missing), STORE_BATCH_SIZE):
+            batch = missing[start:start + STORE_BATCH_SIZE]
+            rendered = await render_commits(repo, batch)
+            metadata = parse_metadata(
+                await run_git(repo, "log", "--no-walk=unsorted", "--numstat", METADATA_FORMAT, *batch)
+            )
+            rows = []
+            for commit_hash in batch:
+                if commit_hash not in rendered:
+                    continue
+                meta = metadata.get(commit_hash, {})
+                rows.append((
+                    repo, commit_hash, meta.get("author"), meta.get("email"), meta.get("date"),
+                    meta.get("subject"), json.dumps(meta.get("files", [])),
+                    meta.get("insertions"), meta.get("deletions"), rendered[commit_hash],
+                ))
+            await asyncio.to_thread(self._insert_commits, rows)
+            self.commits_stored += len(rows)
+
+    def _insert_commits(self, rows: List[tuple]):
+        with self._db_lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO commits (repo, hash, author, email, date, subject, files, "
+                "insertions, deletions, content) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def _update_history(self, repo: str, head: str, new_hashes: List[str], rebuild: bool, total: int):
+        """Record the commit order (newest has the highest seq) and drop commits outside it."""
+        with self._db_lock, self._conn:
+            if rebuild:
+                self._conn.execute("DELETE FROM history WHERE repo = ?", (repo,))
+                next_seq = 0
+            else:
+                row = self._conn.execute("SELECT MAX(seq) FROM history WHERE repo = ?", (repo,)).fetchone()
+                next_seq = 0 if row[0] is None else row[0] + 1
+            self._conn.executemany(
+                "INSERT INTO history (repo, seq, hash) VALUES (?, ?, ?)",
+                [(repo, next_seq + i, h) for i, h in enumerate(reversed(new_hashes))],
+            )
+            self._conn.execute(
+                "DELETE FROM history WHERE repo = ? AND seq <= ?",
+                (repo, next_seq + len(new_hashes) - 1 - self.max_commits),
+            )
+            self._conn.execute(
+                "DELETE FROM commits WHERE repo = ? AND hash NOT IN (SELECT hash FROM history WHERE repo = ?)",
+                (repo, repo),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO repos (repo, head, total_commits, indexed_at) VALUES (?, ?, ?, ?)",
+                (repo, head, total, time.time()),
+            )
+
+    def _schedule_refresh(self, repo: str, head: str):
+        """Start indexing repo up to head in the background unless it is already running."""
+        if repo in self._refreshing:
+            return
+        task = asyncio.create_task(self._refresh_in_background(repo, head))
+        self._refreshing[repo] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(repo, None))
+
+    async def _refresh_in_background(self, repo: str, head: str):
+        try:
+            await self.refresh(repo, head)
+        except Exception as e:
+            logger.warning(f"Commit database not available for {repo}: {str(e)}")
+
+    async def _current(self, repo_path: str) -> Optional[str]:
+        """
+        Check that the database matches HEAD of the repository. Otherwise the
+        repository is registered or refreshed in the background, so the
+        request does not wait for it.
+
+        Returns:
+            Repository identifier, None if the database cannot serve it (yet)
+        """
+        if not self.enabled or self._conn is None or not os.path.isdir(repo_path):
+            return None
+        repo = repo_id(repo_path)
+        head = read_head(repo)
+        if head is None:
+            try:
+                head = (await run_git(repo, "rev-parse", "HEAD")).strip()
+            except Exception as e:
+                logger.warning(f"Commit database not available for {repo}: {str(e)}")
+                return None
+        if head != self._heads.get(repo):
+            self._schedule_refresh(repo, head)
+            return None
+        return repo
+
+    async def commit_hashes(self, repo_path: str, num_commits: int) -> Optional[List[str]]:
+        """
+        Hashes of the last num_commits commits, newest first.
+
+        Returns:
+            The hashes, or None if the database cannot answer (disabled, or
+            more commits requested than it keeps)
+        """
+        if num_commits > self.max_commits:
+            return None
+        repo = await self._current(repo_path)
+        if repo is None:
+            return None
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT hash FROM history WHERE repo = ? ORDER BY seq DESC LIMIT ?",
+            (repo, num_commits),
+        )
+        self.hits += 1
+        return [row[0] for row in rows]
+
+    async def count_commits(self, repo_path: str) -> Optional[int]:
+        """Number of commits reachable from HEAD, None if the database cannot answer."""
+        repo = await self._current(repo_path)
+        if repo is None:
+            return None
+        rows = await asyncio.to_thread(self._query, "SELECT total_commits FROM repos WHERE repo = ?", (repo,))
+        if not rows:
+            return None
+        self.hits += 1
+        return rows[0][0]
+
+    async def get_many(self, repo_path: str, hashes: List[str]) -> Dict[str, dict]:
+        """
+        Stored commits with their metadata.
+
+        Returns:
+            Mapping of commit hash to author, email, date, subject, files,
+            insertions, deletions and content for the commits found
+        """
+        if not self.enabled or self._conn is None or not hashes:
+            return {}
+        repo = repo_id(repo_path)
+        found = {}
+        for start in range(0, len(hashes), STORE_BATCH_SIZE):
+            batch = hashes[start:start + STORE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = await asyncio.to_thread(
+                self._query,
+                "SELECT hash, author, email, date, subject, files, insertions, deletions, content "
+                f"FROM commits WHERE repo = ? AND hash IN ({placeholders})",
+                (repo, *batch),
+            )
+            for commit_hash, author, email, date, subject, files, insertions, deletions, content in rows:
+                found[commit_hash] = {
+                    "author": author,
+                    "email": email,
+                    "date": date,
+                    "subject": subject,
+                    "files": json.loads(files) if files else [],
+                    "insertions": insertions,
+                    "deletions": deletions,
+                    "content": content,
+                }
+        return found
+
+    def stats(self) -> dict:
+        """Indexed repositories and refresh counters."""
+        return {
+            "enabled": self.enabled,
+            "repos": {repo: head for repo, head in self._heads.items()},
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "rebuilds": self.rebuilds,
+            "commits_stored": self.commits_stored,
+        }
+
+
+# Shared commit database for /git/history
+commit_db = CommitDatabase(settings.commit_db_path or None, settings.commit_db_max_commits)
@@ -0,0 +1,336 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from app.config import settings
+from app.git import KeyedLocks, repo_id
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Identifiers and numbers; identifiers are also split at "_" and camelCase
+WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Constant of reciprocal rank fusion of BM25 and embedding rankings
+RRF_K = 60
+
+# Commits rendered at a time while indexing
+INDEX_BATCH_SIZE = 200
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase search terms of a text, identifiers with their parts."""
+    tokens = []
+    for word in WORD_RE.findall(text):
+        if len(word) > 1:
+            tokens.append(word.lower())
+        parts = [part.lower() for piece in word.split("_") for part in CAMEL_RE.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if len(part) > 1)
+    return tokens
+
+
+def commit_document(content: str, max_diff_chars: int) -> str:
+    """
+    Searchable text of a rendered commit: the message and touched paths
+    (twice, so they weigh more than the diff) and the changed diff lines.
+    """
+    header, separator, diff = content.partition("\ndiff --")
+    message = "\n".join(line.strip() for line in header.split("\n") if line.startswith("    "))
+    paths = []
+    hunks = []
+    hunk_chars = 0
+    for line in f"diff --{diff}".split("\n") if separator else []:
+        if line.startswith("diff --git "):
+            paths.append(line.rsplit(" b/", 1)[-1])
+        elif line.startswith("diff --cc ") or line.startswith("diff --combined "):
+            paths.append(line.split(" ", 2)[-1])
+        elif line.startswith("+++ ") or line.startswith("--- "):
+            continue
+        elif line[:1] in ("+", "-", "@") and hunk_chars < max_diff_chars:
+            hunks.append(line.lstrip("+-@ "))
+            hunk_chars += len(line)
+    paths_text = "\n".join(paths)
+    return "\n".join([message, message, paths_text, paths_text, *hunks])
+
+
+class RepoIndex:
+    """
+    BM25 index over the commits of one repository.
+
+    Commits are only ever added, in the order they were indexed. With a
+    path, every added commit is appended as one JSON line, so the index
+    is updated on disk incrementally and loaded back on restart.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.hashes: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.lengths: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}  # Term -> document -> term frequency
+        self.vectors: List[Optional[List[float]]] = []
+        self.total_length = 0
+
+    def __contains__(self, commit_hash: str) -> bool:
+        return commit_hash in self.positions
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def _add(self, commit_hash: str, terms: Dict[str, int], vector: Optional[List[float]]):
+        if commit_hash in self.positions:
+            return
+        doc = len(self.hashes)
+        self.hashes.append(commit_hash)
+        self.positions[commit_hash] = doc
+        length = sum(terms.values())
+        self.lengths.append(length)
+        self.total_length += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc] = tf
+        self.vectors.append(vector)
+
+    def load(self):
+        """Read the index file, ignoring a partly written last line."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping damaged entry in commit index {self.path}")
+                    continue
+                self._add(entry["hash"], entry["terms"], entry.get("vector"))
+
+    def add_many(self, documents: List[tuple]):
+        """
+        Index commits and append them to the index file.
+
+        Args:
+            documents: (commit_hash, text, vector) tuples, vector may be None
+        """
+        lines = []
+        for commit_hash, text, vector in documents:
+            if commit_hash in self.positions:
+                continue
+            terms = dict(Counter(tokenize(text)))
+            self._add(commit_hash, terms, vector)
+            entry = {"hash": commit_hash, "terms": terms}
+            if vector is not None:
+                entry["vector"] = vector
+            lines.append(json.dumps(entry) + "\n")
+        if self.path and lines:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except OSError as e:
+                logger.warning(f"Error writing commit index {self.path}: {str(e)}")
+
+    def bm25(self, query_terms: Iterable[str], allowed: Optional[set] = None) -> Dict[int, float]:
+        """BM25 score of every document that contains a query term."""
+        count = len(self.hashes)
+        if not count:
+            return {}
+        average_length = self.total_length / count or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings.items():
+                if allowed is not None and self.hashes[doc] not in allowed:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / average_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def similarity(self, query_vector: List[float], allowed: Optional[set] = None) -> Dict[int, float]:
+        """Cosine similarity of the query to every document with a (normalized) vector."""
+        scores = {}
+        for doc, vector in enumerate(self.vectors):
+            if vector is None or (allowed is not None and self.hashes[doc] not in allowed):
+                continue
+            scores[doc] = sum(a * b for a, b in zip(query_vector, vector))
+        return scores
+
+
+class Embedder:
+    """
+    Optional CPU embedding model (sentence-transformers).
+
+    Loaded on first use; if the package or model is not available the index
+    falls back to BM25 only.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self.available = bool(model_name)
+
+    def _load(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def embed(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Normalized embeddings of texts, None when embeddings are not available."""
+        if not self.available or not texts:
+            return None
+        try:
+            vectors = self._load().encode(texts, normalize_embeddings=True)
+        except Exception as e:
+            logger.warning(f"Embedding model {self.model_name} not available, using BM25 only: {str(e)}")
+            self.available = False
+            return None
+        return [[round(float(value), 5) for value in vector] for vector in vectors]
+
+
+class CommitIndex:
+    """
+    Search indexes of commit messages, touched paths and diff hunks, one
+    per repository, used to pick the commits relevant to a query from the
+    whole history.
+
+    Indexes are brought up to date on every search: commits that are not
+    indexed yet are rendered and added, so only new commits cost work.
+    Commits that are no longer reachable (e.g. after a force push) stay in
+    the index but are never returned.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_diff_chars: int = 20000,
+                 embedding_model: str = ""):
+        """
+        Args:
+            directory: Directory of the index files, None to keep indexes in memory only
+            max_diff_chars: Characters of changed diff lines indexed per commit
+            embedding_model: sentence-transformers model for hybrid search, empty for BM25 only
+        """
+        self.directory = directory
+        self.max_diff_chars = max_diff_chars
+        self.embedder = Embedder(embedding_model)
+        self._indexes: Dict[str, RepoIndex] = {}
+        self._lock = KeyedLocks()  # Per repository
+        self.searches = 0
+        self.commits_indexed = 0
+
+    def _path(self, repo: str) -> Optional[str]:
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, f"{hashlib.sha256(repo.encode()).hexdigest()[:16]}.jsonl")
+
+    async def _index(self, repo: str) -> RepoIndex:
+        index = self._indexes.get(repo)
+        if index is None:
+            index = RepoIndex(self._path(repo))
+            await asyncio.to_thread(index.load)
+            self._indexes[repo] = index
+        return index
+
+    def _documents(self, commits: Dict[str, str]) -> List[tuple]:
+        hashes = list(commits)
+        texts = [commit_document(commits[commit_hash], self.max_diff_chars) for commit_hash in hashes]
+        vectors = self.embedder.embed(texts) or [None] * len(texts)
+        return list(zip(hashes, texts, vectors))
+
+    async def update(
+        self,
+        repo_path: str,
+        commit_hashes: List[str],
+        render: Callable[[str, List[str]], Awaitable[Dict[str, str]]],
+    ):
+        """
+        Add the given commits that are not indexed yet.
+
+        Args:
+            repo_path: Path to the git repository
+            commit_hashes: Commits that should be searchable, newest first
+            render: Coroutine function returning {hash: rendered commit} for a repo and hashes
+        """
+        repo = repo_id(repo_path)
+        async with self._lock(repo):
+            index = await self._index(repo)
+            # Oldest first, so document order follows history
+            missing = [h for h in reversed(commit_hashes) if h not in index]
+            if missing:
+                logger.info(f"Indexing {len(missing)} commits of {repo}")
+            for start in range(0, len(missing), INDEX_BATCH_SIZE):
+                batch = missing[start:start + INDEX_BATCH_SIZE]
+                rendered = await render(repo_path, batch)
+                commits = {h: rendered[h] for h in batch if h in rendered}
+                documents = await asyncio.to_thread(self._documents, commits)
+                await asyncio.to_thread(index.add_many, documents)
+                self.commits_indexed += len(documents)
+
+    async def search(self, repo_path: str, query: str, top_k: int,
+                     allowed: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Hashes of the top_k commits most relevant to query, best first.
+
+        With embeddings, the BM25 and embedding rankings are merged by
+        reciprocal rank fusion.
+
+        Args:
+            repo_path: Path to the git repository
+            query: User's text query
+            top_k: Number of commits to return
+            allowed: Only return these commits, e.g. the ones reachable from HEAD
+        """
+        self.searches += 1
+        repo = repo_id(repo_path)
+        allowed = set(allowed) if allowed is not None else None
+
+        def rank():
+            rankings = [index.bm25(tokenize(query), allowed)]
+            query_vectors = self.embedder.embed([query]) if any(v is not None for v in index.vectors) else None
+            if query_vectors:
+                rankings.append(index.similarity(query_vectors[0], allowed))
+            if len(rankings) == 1:
+                scores = rankings[0]
+            else:
+                scores = {}
+                for ranking in rankings:
+                    ordered = sorted(ranking, key=ranking.get, reverse=True)
+                    for position, doc in enumerate(ordered):
+                        scores[doc] = scores.get(doc, 0.0) + 1.0 / (RRF_K + position + 1)
+            # Newer commits first among equal scores
+            best = sorted(scores, key=lambda doc: (scores[doc], doc), reverse=True)[:top_k]
+            return [index.hashes[doc] for doc in best]
+
+        # Indexing and searching a repository do not overlap
+        async with self._lock(repo):
+            index = await self._index(repo)
+            return await asyncio.to_thread(rank)
+
+    def stats(self) -> dict:
+        """Indexed repositories and commits."""
+        return {
+            "repos": len(self._indexes),
+            "commits": sum(len(index) for index in self._indexes.values()),
+            "commits_indexed": self.commits_indexed,
+            "searches": self.searches,
+            "embeddings": self.embedder.available,
+        }
+
+
+# Shared commit search index for /git/history
+commit_index = CommitIndex(
+    settings.commit_index_dir or None,
+    settings.commit_index_max_diff_chars,
+    settings.commit_index_embedding_model,
+)
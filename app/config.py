@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -5,6 +7,70 @@ class Settings(BaseSettings):
     port: int = 8000
     original_server_url: str = "http://localhost:8080"  # Default URL to the original server
     original_server_timeout: float = 60.0  # Timeout for requests to original server in seconds
+    original_server_connect_timeout: float = 5.0  # Timeout for connecting to the original server in seconds
+    backend_urls: str = ""  # Comma-separated llama.cpp servers sharing one session directory, empty = original_server_url
+    backend_health_check_interval: float = 10.0  # Seconds between backend health checks, 0 = disabled
+    backend_unhealthy_after: int = 2  # Consecutive failures before a backend stops receiving requests
+    backend_max_connections: int = 64  # Pooled connections to the original server
+    backend_max_keepalive_connections: int = 32  # Idle connections kept open
+    backend_keepalive_expiry: float = 30.0  # Seconds an idle connection is kept
+    backend_http2: bool = False  # Use HTTP/2 to the original server (needs the h2 package)
+    num_slots: int = 0  # Number of original server slots to use, 0 = detect from the server
+    slot_residency: bool = True  # Skip restore/save while a session stays loaded in its slot
+    session_write_back_interval: float = 60.0  # Seconds between saves of resident sessions, 0 = only on eviction
+    session_save_mode: str = "sync"  # "sync" saves before responding, "background" saves from a write-behind queue
+    session_save_workers: int = 2  # Number of concurrent background saves
+    session_dir: str = ""  # Slot save directory of the original servers (--slot-save-path), empty = not managed
+    session_max_bytes: int = 0  # Size limit of all session files, least recently used are deleted first, 0 = no limit
+    session_ttl: float = 0  # Delete sessions not used for this many seconds, 0 = keep
+    session_sweep_interval: float = 60.0  # Seconds between session quota and TTL checks
+    session_cold_dir: str = ""  # Directory of compressed (cold) sessions, empty = no cold tier
+    session_cold_after: float = 0  # Compress sessions not used for this many seconds, 0 = only when over the quota
+    session_cold_max_bytes: int = 0  # Size limit of the compressed sessions, 0 = no limit
+    session_compression: str = "zstd"  # "zstd" or "lz4" (need the zstandard / lz4 packages, else gzip) or "gzip"
+    session_compression_workers: int = 2  # Threads compressing and decompressing sessions
+    session_read_ahead: bool = True  # Read session files into the page cache while requests wait
+    server_timing: bool = True  # Return per-stage durations in a Server-Timing header
+    batch_concurrency: int = 0  # Keys of a /v1/batch/completions request run at once, 0 = number of slots
+    batch_max_items: int = 10000  # Most items accepted in one batch
+    coalesce_requests: bool = False  # Merge identical in-flight requests for a key into one backend call
+    git_max_concurrency: int = 4  # Max git processes running at the same time
+    git_timeout: float = 60.0  # Timeout for a single git command in seconds
+    commit_cache_max_bytes: int = 256 * 1024 * 1024  # Memory tier size of the rendered commit cache
+    commit_cache_dir: str = ""  # Directory of the on-disk commit cache tier, empty = memory only
+    commit_cache_disk_max_bytes: int = 0  # Size limit of the on-disk tier, 0 = unlimited
+    git_history_dispatch: str = "inprocess"  # "inprocess" calls the session service directly, "http" POSTs to it
+    session_service_url: str = ""  # Session service for "http" dispatch, empty = this server (host/port)
+    git_history_prompt_layout: str = "legacy"  # "legacy" or "prefix_stable" (fixed instructions, oldest commit first)
+    git_history_max_commits: int = 1000  # Most commits considered when filling a token budget
+    git_history_max_commit_tokens: int = 0  # Commits above this are reduced to a file stat, 0 = a quarter of the budget
+    git_history_incremental: bool = True  # Follow-up queries send only new commits as a new turn of the conversation
+    git_history_max_turns: int = 16  # Start a new conversation after this many turns
+    git_history_max_conversation_tokens: int = 32768  # Start a new conversation above this many (estimated) tokens, 0 = no limit
+    git_history_search_top_k: int = 0  # Pick this many commits relevant to the query from the index, 0 = most recent
+    response_cache_max_entries: int = 1000  # Cached /git/history answers, 0 = no caching
+    response_cache_ttl: float = 3600.0  # Seconds a cached /git/history answer is served, 0 = until HEAD moves
+    commit_db_path: str = ""  # sqlite database of indexed commits, empty = read history with git on every request
+    commit_db_repos: str = ""  # Comma-separated repositories indexed in the background
+    commit_db_refresh_interval: float = 30.0  # Seconds between checks for new commits of indexed repositories
+    commit_db_max_commits: int = 10000  # Most recent commits of a repository kept in the database
+    commit_index_dir: str = ""  # Directory of the on-disk commit search indexes, empty = memory only
+    commit_index_max_commits: int = 10000  # Most recent commits of a repository that are indexed
+    commit_index_max_diff_chars: int = 20000  # Characters of changed diff lines indexed per commit
+    commit_index_embedding_model: str = ""  # sentence-transformers model for hybrid search, empty = BM25 only
+    token_count_mode: str = "estimate"  # "estimate" (chars per token) or "backend" (original server /tokenize)
+    token_estimate_chars_per_token: float = 3.5  # Average characters per token for estimates
+
+    @property
+    def backend_url_list(self) -> List[str]:
+        """URLs of all llama.cpp servers."""
+        urls = [url.strip().rstrip("/") for url in self.backend_urls.split(",") if url.strip()]
+        return urls or [self.original_server_url]
+
+    @property
+    def commit_db_repo_list(self) -> List[str]:
+        """Repositories indexed in the commit database in the background."""
+        return [repo.strip() for repo in self.commit_db_repos.split(",") if repo.strip()]
     
     class Config:
         env_file = ".env"
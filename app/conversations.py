@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Set
+
+from app.config import settings
+from app.git import KeyedLocks
+from app.tokens import token_counter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class Conversation:
+    """Messages sent in one session so far and the commits they contain."""
+
+    def __init__(self, repo_path: str, layout: str):
+        self.repo_path = repo_path
+        self.layout = layout
+        self.messages: List[dict] = []
+        self.commits: Set[str] = set()
+        self.tokens = 0  # Estimated prompt tokens of all messages
+
+    @property
+    def turns(self) -> int:
+        return sum(1 for message in self.messages if message["role"] == "user")
+
+    def add_turn(self, message: str, reply: str, commit_hashes: List[str]):
+        """Append a user message, the assistant reply and the commits the message contained."""
+        self.messages.append({"role": "user", "content": message})
+        self.messages.append({"role": "assistant", "content": reply})
+        self.commits.update(commit_hashes)
+        self.tokens += token_counter.estimate(message) + token_counter.estimate(reply)
+
+
+class ConversationStore:
+    """
+    Conversations of /git/history sessions, so a follow-up query sends only
+    the commits the session has not seen yet.
+
+    A session key always maps to the same saved llama.cpp session. Resending
+    the previous turns unchanged keeps them a prefix of the new prompt, so
+    the original server only evaluates the new turn. Conversations are kept
+    in memory, the least recently used are dropped above max_entries.
+    """
+
+    def __init__(self, max_turns: int = 16, max_tokens: int = 32768, max_entries: int = 1000):
+        """
+        Args:
+            max_turns: Start over after this many turns
+            max_tokens: Start over once the conversation has this many (estimated) tokens, 0 for no limit
+            max_entries: Number of conversations kept
+        """
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_entries = max_entries
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._locks = KeyedLocks()
+        self.follow_ups = 0
+        self.restarts = 0
+        self.commits_skipped = 0
+
+    def lock(self, key: str) -> asyncio.Lock:
+        """Lock that serializes the turns of a conversation."""
+        return self._locks(key)
+
+    def get(self, key: str, repo_path: str, layout: str) -> Optional[Conversation]:
+        """
+        The conversation to continue for key, or None to start a new one.
+
+        A conversation is not continued for a different repository or layout,
+        or once it reached the turn or token limit.
+        """
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            return None
+        if conversation.repo_path != repo_path or conversation.layout != layout:
+            reason = "repository or layout changed"
+        elif conversation.turns >= self.max_turns:
+            reason = f"{conversation.turns} turns"
+        elif self.max_tokens and conversation.tokens >= self.max_tokens:
+            reason = f"{conversation.tokens} tokens"
+        else:
+            self._conversations.move_to_end(key)
+            return conversation
+        logger.info(f"Starting a new conversation for {key}: {reason}")
+        self.reset(key)
+        return None
+
+    def put(self, key: str, conversation: Conversation):
+        """Store the conversation of key after a successful turn."""
+        self._conversations[key] = conversation
+        self._conversations.move_to_end(key)
+        while len(self._conversations) > self.max_entries:
+            oldest, _ = self._conversations.popitem(last=False)
+            self._locks.discard(oldest)
+
+    def reset(self, key: str):
+        """Forget the conversation of key, the next query sends the full history."""
+        if self._conversations.pop(key, None) is not None:
+            self.restarts += 1
+
+    def stats(self) -> dict:
+        """Conversation counts and commits that did not have to be resent."""
+        return {
+            "conversations": len(self._conversations),
+            "follow_ups": self.follow_ups,
+            "restarts": self.restarts,
+            "commits_skipped": self.commits_skipped,
+        }
+
+
+# Conversations of /git/history sessions
+conversation_store = ConversationStore(
+    settings.git_history_max_turns,
+    settings.git_history_max_conversation_tokens,
+)
@@ -0,0 +1,225 @@
+import asyncio
+import codecs
+import io
+import locale
+import logging
+import os
+import subprocess
+from typing import AsyncIterator, Dict, Optional
+
+from app.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Commits rendered per git invocation
+RENDER_BATCH_SIZE = 1000
+
+# Limits how many git processes run at the same time
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _git_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.git_max_concurrency)
+    return _semaphore
+
+
+def repo_id(repo_path: str) -> str:
+    """Stable identifier of a repository path, the same for every cache and index."""
+    return os.path.realpath(repo_path)
+
+
+class KeyedLocks:
+    """asyncio locks created on first use, one per key, e.g. per repository."""
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def __call__(self, key: str) -> asyncio.Lock:
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+        return self._locks[key]
+
+    def discard(self, key: str):
+        """Drop the lock of key unless it is held."""
+        lock = self._locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._locks[key]
+
+
+def _text_decoder():
+    """Decoder matching subprocess text mode: locale encoding, universal newlines."""
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))()
+    return io.IncrementalNewlineDecoder(decoder, translate=True)
+
+
+async def _kill(process: asyncio.subprocess.Process):
+    if process.returncode is None:
+        process.kill()
+        await process.wait()
+
+
+async def run_git(repo_path: str, *args: str, timeout: Optional[float] = None) -> str:
+    """
+    Run a git command without blocking the event loop.
+
+    Args:
+        repo_path: Path to the git repository
+        args: git subcommand and its arguments
+        timeout: Seconds before the process is killed (default: GIT_TIMEOUT)
+
+    Returns:
+        Standard output of the command
+
+    Raises:
+        subprocess.CalledProcessError: git exited with a non-zero status
+        subprocess.TimeoutExpired: git did not finish in time
+    """
+    cmd = ["git", "-C", repo_path, *args]
+    timeout = settings.git_timeout if timeout is None else timeout
+
+    async with _git_semaphore():
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        finally:
+            await _kill(process)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, cmd, stderr=_text_decoder().decode(stderr, final=True)
+        )
+    return _text_decoder().decode(stdout, final=True)
+
+
+async def stream_git(
+    repo_path: str, *args: str, timeout: Optional[float] = None, chunk_size: int = 65536
+) -> AsyncIterator[str]:
+    """
+    Run a git command and yield its output as text chunks while it runs.
+
+    Raises the same exceptions as run_git, once the output has been consumed.
+    """
+    cmd = ["git", "-C", repo_path, *args]
+    timeout = settings.git_timeout if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    decoder = _text_decoder()
+
+    async with _git_semaphore():
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        # Drain stderr concurrently so a chatty git cannot block on a full pipe
+        stderr_task = asyncio.ensure_future(process.stderr.read())
+        try:
+            while True:
+                data = await asyncio.wait_for(
+                    process.stdout.read(chunk_size), max(deadline - loop.time(), 0)
+                )
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    yield text
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield text
+
+            await asyncio.wait_for(process.wait(), max(deadline - loop.time(), 0))
+            stderr = await stderr_task
+        except asyncio.TimeoutError:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        finally:
+            stderr_task.cancel()
+            await _kill(process)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, cmd, stderr=_text_decoder().decode(stderr, final=True)
+        )
+
+
+class GitLogParser:
+    """
+    Incremental parser for the output of `git log -p --cc -z`.
+
+    With -z, git separates commits with NUL instead of a newline. For merge
+    commits it also writes NUL instead of the newline between the header and
+    the combined diff, so that part is glued back on. Each record is exactly
+    what `git show <hash>` prints for the commit.
+    """
+
+    def __init__(self):
+        self._pending = []  # Pieces of the part that is still being read
+        self._merge_header = None
+
+    def feed(self, chunk: str):
+        """
+        Consume a chunk of git output.
+
+        Returns:
+            List of (commit_hash, content) tuples completed by the chunk
+        """
+        records = []
+        *complete, rest = chunk.split("\0")
+        for piece in complete:
+            self._pending.append(piece)
+            self._add_part("".join(self._pending), records)
+            self._pending = []
+        if rest:
+            self._pending.append(rest)
+        return records
+
+    def close(self):
+        """Finish parsing and return the remaining records."""
+        records = []
+        if self._pending or self._merge_header is not None:
+            self._add_part("".join(self._pending), records)
+            self._pending = []
+        return records
+
+    def _add_part(self, part: str, records: list):
+        if self._merge_header is not None:
+            content = f"{self._merge_header}\n{part}"
+            self._merge_header = None
+        elif is_merge_header(part):
+            self._merge_header = part
+            return
+        else:
+            content = part
+        # First line is "commit <hash>"
+        records.append((content.split("\n", 1)[0].split()[1], content))
+
+
+def is_merge_header(part: str) -> bool:
+    """Check if a git log record part is the header of a merge commit."""
+    lines = part.split("\n", 2)
+    return len(lines) > 1 and lines[1].startswith("Merge: ")
+
+
+async def render_commits(repo_path: str, commit_hashes):
+    """
+    Render commits the way `git show` does, with one streamed `git log -p`
+    per batch of commits.
+
+    Returns:
+        Mapping of commit hash to rendered content
+    """
+    rendered = {}
+    # Keep the command line well below the OS argument size limit
+    for start in range(0, len(commit_hashes), RENDER_BATCH_SIZE):
+        batch = commit_hashes[start:start + RENDER_BATCH_SIZE]
+        parser = GitLogParser()
+        async for chunk in stream_git(
+            repo_path, "log", "--no-walk=unsorted", "-p", "--cc", "--root", "-z", *batch
+        ):
+            rendered.update(parser.feed(chunk))
+        rendered.update(parser.close())
+    return rendered
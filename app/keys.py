@@ -0,0 +1,82 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class KeyScheduler:
+    """
+    Orders requests per session key.
+
+    Requests for the same key run one at a time in arrival order (asyncio
+    locks wake waiters first in, first out), so no two requests restore or
+    save the same session concurrently. Different keys run in parallel.
+    Identical requests that are in flight at the same time can optionally be
+    merged into one backend call.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._depth: Dict[str, int] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.max_depth = 0
+        self.coalesced = 0
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        """Wait for the turn of this request among the requests for key."""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        depth = self._depth[key] = self._depth.get(key, 0) + 1
+        self.max_depth = max(self.max_depth, depth)
+
+        try:
+            async with lock:
+                yield
+        finally:
+            self._depth[key] -= 1
+            if self._depth[key] == 0:
+                del self._depth[key]
+                del self._locks[key]
+
+    @staticmethod
+    def fingerprint(key: str, request: dict) -> str:
+        """Identity of a request for coalescing."""
+        return f"{key}:{json.dumps(request, sort_keys=True)}"
+
+    async def coalesce(self, fingerprint: str, run: Callable[[], Awaitable]):
+        """
+        Run the request, or join an identical one that is already in flight.
+
+        The shared call keeps running if the request that started it goes
+        away, so the others still get the result.
+        """
+        future = self._inflight.get(fingerprint)
+        if future is not None:
+            self.coalesced += 1
+            logger.info(f"Joining identical in-flight request")
+        else:
+            future = asyncio.ensure_future(run())
+            self._inflight[fingerprint] = future
+            future.add_done_callback(lambda _: self._inflight.pop(fingerprint, None))
+        return await asyncio.shield(future)
+
+    def depth(self, key: str) -> int:
+        """Number of requests for key that are running or waiting."""
+        return self._depth.get(key, 0)
+
+    def stats(self) -> dict:
+        """Per-key queue depths and coalescing counters."""
+        return {
+            "active_keys": len(self._depth),
+            "queued": sum(depth - 1 for depth in self._depth.values()),
+            "max_depth": self.max_depth,
+            "depth": dict(self._depth),
+            "inflight": len(self._inflight),
+            "coalesced": self.coalesced,
+        }
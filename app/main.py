@@ -1,10 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
 import uvicorn
-from pydantic import BaseModel
-import httpx
 import logging
+import time
 from app.config import settings
-from app.routers import git_history
+from app import metrics
+from app.clients import backend_client
+from app.commit_cache import commit_cache
+from app.commit_db import commit_db
+from app.commit_index import commit_index
+from app.response_cache import response_cache
+from app.conversations import conversation_store
+from app.models import ExtendedRequest
+from app.sessions import session_service
+from app.tokens import token_counter
+from app.routers import batch, git_history, sessions
+from app.session_store import session_store
 
 # Configure logging
 logging.basicConfig(
@@ -13,118 +25,79 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    backend_client.start()
+    await session_service.start()
+    await commit_db.start(settings.commit_db_repo_list, settings.commit_db_refresh_interval)
+    yield
+    await commit_db.stop()
+    await session_service.stop()
+    await backend_client.close()
+
 # Initialize FastAPI app
-app = FastAPI(title="Session Management Service")
+app = FastAPI(title="Session Management Service", lifespan=lifespan)
 
 # Include routers
+app.include_router(batch.router)
 app.include_router(git_history.router)
-
-# Data models
-class ExtendedRequest(BaseModel):
-    key: str
-    request: dict
-
-# Create HTTP client
-http_client = httpx.AsyncClient(timeout=settings.original_server_timeout)
+app.include_router(sessions.router)
 
 @app.post("/v1/chat/completions")
 async def handle_request(extended_request: ExtendedRequest):
     """
     Wrapper endpoint that:
-    1. Restores session from the original server
+    0. Waits for earlier requests with the same key, then leases a slot of
+       the original server, preferring the one that still holds the session
+       and waiting if all slots are busy
+    1. Restores session from the original server, unless it is still resident
     2. Forwards the request to the original server
-    3. Saves the session back to the original server
+    3. Saves the session back to the original server (with slot residency,
+       only when the slot is handed to another key or on write-back; in
+       background save mode, after the response has been returned)
     4. Returns the response to the client
+
+    Requests with "stream": true are streamed through as they are generated.
+    The pipeline itself lives in SessionService. Stage durations are returned
+    in a Server-Timing header.
     """
-    try:
-        # Step 1: Restore session
-        filename = f"{extended_request.key}.bin"
-        restore_url = f"{settings.original_server_url}/slots/0?action=restore"
-        restore_payload = {"filename": filename}
-        
-        logger.info(f"Restoring session for key: {extended_request.key}")
-        restore_response = await http_client.post(
-            restore_url, 
-            json=restore_payload,
-            headers={"content-type": "application/json"}
-        )
-        
-        restore_data = None
-        if restore_response.status_code == 200:
-            try:
-                restore_data = restore_response.json()
-                logger.info(
-                    f"Session restore details: id_slot={restore_data.get('id_slot')}, "
-                    f"filename={restore_data.get('filename')}, "
-                    f"n_restored={restore_data.get('n_restored')}, "
-                    f"n_read={restore_data.get('n_read')}, "
-                    f"restore_ms={restore_data.get('timings', {}).get('restore_ms')}"
-                )
-            except Exception as e:
-                logger.error(f"Error parsing restore response: {str(e)}")
-        else:
-            logger.error(f"Session restore failed: {restore_response.text}")
-            # Continue anyway, might be a new session
-        
-        # Step 2: Forward the request to the original server
-        forward_url = f"{settings.original_server_url}/v1/chat/completions"
-        logger.info(f"Forwarding request to original server")
-        
-        forward_response = await http_client.post(
-            forward_url,
-            json=extended_request.request,
-            headers={"content-type": "application/json"}
-        )
-        
-        if forward_response.status_code != 200:
-            logger.error(f"Original server request failed: {forward_response.text}")
-            return HTTPException(
-                status_code=forward_response.status_code,
-                detail="Request to original server failed"
-            )
-        
-        # Get the response data
-        response_data = forward_response.json()
-        
-        # Step 3: Save the session
-        save_url = f"{settings.original_server_url}/slots/0?action=save"
-        save_payload = {"filename": filename}
-        
-        logger.info(f"Saving session for key: {extended_request.key}")
-        save_response = await http_client.post(
-            save_url,
-            json=save_payload,
-            headers={"content-type": "application/json"}
-        )
-        
-        save_data = None
-        if save_response.status_code == 200:
-            try:
-                save_data = save_response.json()
-                logger.info(
-                    f"Session save details: id_slot={save_data.get('id_slot')}, "
-                    f"filename={save_data.get('filename')}, "
-                    f"n_saved={save_data.get('n_saved')}, "
-                    f"n_written={save_data.get('n_written')}, "
-                    f"save_ms={save_data.get('timings', {}).get('save_ms')}"
-                )
-            except Exception as e:
-                logger.error(f"Error parsing save response: {str(e)}")
-        else:
-            logger.error(f"Session save failed: {save_response.text}")
-            # Continue anyway, we still want to return the response
-        
-        # Step 4: Return the response to the client
-        return response_data
-    
-    except Exception as e:
-        logger.exception(f"Error processing request: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    stages = {}
+    metrics.request_stages.set(stages)
+    start = time.perf_counter()
+
+    if extended_request.request.get("stream"):
+        response = await session_service.stream(extended_request.key, extended_request.request)
+    else:
+        response_data = await session_service.complete(extended_request.key, extended_request.request)
+        response = JSONResponse(response_data)
+
+    if settings.server_timing:
+        # Streams report the stages before the first byte only
+        stages["total"] = (time.perf_counter() - start) * 1000
+        response.headers["Server-Timing"] = metrics.server_timing(stages)
+    return response
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        **session_service.stats(),
+        "backend_client": backend_client.stats(),
+        "session_store": session_store.stats(),
+        "commit_cache": commit_cache.stats(),
+        "commit_db": commit_db.stats(),
+        "commit_index": commit_index.stats(),
+        "git_history_prompt_cache": git_history.prompt_cache_stats,
+        "git_history_conversations": conversation_store.stats(),
+        "git_history_response_cache": response_cache.stats(),
+        "token_counts": token_counter.stats(),
+    }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Latency histograms and counters in the Prometheus text format"""
+    return Response(metrics.registry.render(), media_type=metrics.registry.content_type)
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host=settings.host, port=settings.port, reload=True)
\ No newline at end of file
+    uvicorn.run("app.main:app", host=settings.host, port=settings.port, reload=True)
@@ -0,0 +1,214 @@
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Generation speed buckets in tokens per second
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# Stage durations in milliseconds of the request being handled, for the Server-Timing header
+request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+
+def record_stage(name: str, seconds: float):
+    """Add to the duration of a stage of the current request, if it is being timed."""
+    stages = request_stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds * 1000
+
+
+@contextmanager
+def stage(name: str, histogram: "Histogram", **labels):
+    """Observe the duration of the block in histogram and as a stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        record_stage(name, elapsed)
+
+
+def server_timing(stages: Dict[str, float]) -> str:
+    """Server-Timing header value for stage durations in milliseconds."""
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in stages.items())
+
+
+class Metric:
+    """Base class for metrics with optional labels."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[tuple, List[int]] = {}
+        self._sums: Dict[tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * len(self.buckets)
+            self._sums[key] = 0.0
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = key + (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text format."""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        metric = Counter(name, documentation)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str,
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+# Shared registry served by /metrics
+registry = MetricsRegistry()
+
+# Session pipeline
+queue_wait_seconds = registry.histogram(
+    "lfnt_queue_wait_seconds", "Time from arrival until a slot is leased (per-key queue and slot wait)")
+restore_seconds = registry.histogram(
+    "lfnt_restore_seconds", "Session restore latency")
+forward_seconds = registry.histogram(
+    "lfnt_forward_seconds", "Completion latency on the original server")
+save_seconds = registry.histogram(
+    "lfnt_save_seconds", "Session save latency")
+request_seconds = registry.histogram(
+    "lfnt_request_seconds", "End-to-end completion latency")
+restore_misses = registry.counter(
+    "lfnt_restore_misses_total", "Requests whose session was not resident and had to be restored")
+restore_failures = registry.counter(
+    "lfnt_restore_failures_total", "Restores rejected by the original server, including new sessions")
+save_failures = registry.counter(
+    "lfnt_save_failures_total", "Saves rejected by the original server")
+bytes_read = registry.counter(
+    "lfnt_session_bytes_read_total", "Session bytes read by restores (n_read)")
+bytes_written = registry.counter(
+    "lfnt_session_bytes_written_total", "Session bytes written by saves (n_written)")
+tokens_per_second = registry.histogram(
+    "lfnt_tokens_per_second", "Generation speed reported in the original server timings",
+    buckets=TOKENS_PER_SECOND_BUCKETS)
+prompt_tokens_per_second = registry.histogram(
+    "lfnt_prompt_tokens_per_second", "Prompt processing speed reported in the original server timings",
+    buckets=TOKENS_PER_SECOND_BUCKETS)
+session_evictions = registry.counter(
+    "lfnt_session_evictions_total", "Session files deleted by the session store quota or TTL")
+session_promote_seconds = registry.histogram(
+    "lfnt_session_promote_seconds", "Time to decompress a cold session back into the hot tier")
+session_demote_seconds = registry.histogram(
+    "lfnt_session_demote_seconds", "Time to compress a session into the cold tier")
+session_read_ahead_seconds = registry.histogram(
+    "lfnt_session_read_ahead_seconds", "Time to read a session file ahead into the page cache")
+
+# /git/history
+git_extraction_seconds = registry.histogram(
+    "lfnt_git_extraction_seconds", "Time to extract and select commits for /git/history")
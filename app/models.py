@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+# Data models
+class ExtendedRequest(BaseModel):
+    key: str
+    request: dict
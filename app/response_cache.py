@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Query with case and whitespace differences removed."""
+    return " ".join(query.split()).casefold()
+
+
+class ResponseCache:
+    """
+    Cache of /git/history answers.
+
+    Entries are keyed by repository, the commit HEAD (and the revision range)
+    pointed to, the normalized query, the commit selection parameters and
+    the model, so an answer is only reused while the history it was computed
+    from is unchanged. When a repository's HEAD moves, all its entries are
+    dropped. Entries also expire after ttl seconds and the least recently
+    used are evicted above max_entries. Identical requests that arrive while
+    the answer is being computed wait for it instead of calling the backend.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0):
+        """
+        Args:
+            max_entries: Number of cached answers, 0 to disable the cache
+            ttl: Seconds an answer is served, 0 for no expiry
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float, dict]]" = OrderedDict()  # Key -> (repo, time, response)
+        self._heads: Dict[str, str] = {}  # Repository -> state the entries were computed for
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(repo: str, state: str, query: str, params: dict, model: str) -> str:
+        """Cache key of an answer, params are the commit selection parameters."""
+        material = json.dumps(
+            [repo, state, normalize_query(query), params, model], sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _invalidate(self, repo: str, state: str):
+        """Drop the entries of repo if they were computed for another state."""
+        if self._heads.get(repo) == state:
+            return
+        if repo in self._heads:
+            stale = [key for key, (entry_repo, _, _) in self._entries.items() if entry_repo == repo]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self.invalidations += 1
+                logger.info(f"History of {repo} moved, dropped {len(stale)} cached answers")
+        self._heads[repo] = state
+
+    def get(self, key: str) -> Optional[Tuple[dict, float]]:
+        """Cached response and its age in seconds, None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        _, created, response = entry
+        age = time.monotonic() - created
+        if self.ttl and age > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response, age
+
+    def put(self, key: str, repo: str, response: dict):
+        self._entries[key] = (repo, time.monotonic(), response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        repo: str,
+        state: str,
+        compute: Callable[[], Awaitable[dict]],
+        refresh: bool = False,
+    ) -> Tuple[dict, str, float]:
+        """
+        Answer from the cache, or compute and cache it.
+
+        Args:
+            key: Cache key from make_key
+            repo: Repository identifier
+            state: HEAD (and revision range) the answer is computed for
+            compute: Coroutine function producing the answer
+            refresh: Compute a new answer even if one is cached
+
+        Returns:
+            Tuple of the response, "HIT" or "MISS", and the age of a hit in seconds
+        """
+        self._invalidate(repo, state)
+        if not refresh:
+            cached = self.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached[0], "HIT", cached[1]
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                # None if the other request failed, compute again then
+                response = await asyncio.shield(in_flight)
+                if response is not None:
+                    self.hits += 1
+                    return response, "HIT", 0.0
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            response = await compute()
+        except BaseException:
+            future.set_result(None)
+            raise
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        future.set_result(response)
+        if self._heads.get(repo) == state:
+            self.put(key, repo, response)
+        return response, "MISS", 0.0
+
+    def stats(self) -> dict:
+        """Cached answers and hit counters."""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+# Shared cache of /git/history answers
+response_cache = ResponseCache(settings.response_cache_max_entries, settings.response_cache_ttl)
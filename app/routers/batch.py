@@ -0,0 +1,189 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional
+from app.config import settings
+from app.models import ExtendedRequest
+from app.sessions import session_service
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Create router
+router = APIRouter(
+    prefix="/v1/batch",
+    tags=["batch"],
+    responses={404: {"description": "Not found"}},
+)
+
+# Content types read as one ExtendedRequest per line
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/jsonlines")
+
+# Data models
+class BatchRequest(BaseModel):
+    items: List[ExtendedRequest]
+    concurrency: Optional[int] = None  # Keys processed at the same time, defaults to the number of slots
+
+
+def parse_batch(body: bytes, content_type: str) -> BatchRequest:
+    """
+    Read a batch from a JSON body ({"items": [...]}) or from JSON lines with
+    one {"key", "request"} object per line.
+
+    Raises:
+        ValueError: The body is not a valid batch
+    """
+    try:
+        if content_type.split(";")[0].strip() in NDJSON_CONTENT_TYPES:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+            return BatchRequest(items=items)
+        return BatchRequest.model_validate_json(body)
+    except (json.JSONDecodeError, ValidationError) as e:
+        raise ValueError(f"Invalid batch: {str(e)}")
+
+
+def group_by_key(items: List[ExtendedRequest]) -> "OrderedDict[str, List[int]]":
+    """Item indexes per key, keys in order of first appearance."""
+    groups: "OrderedDict[str, List[int]]" = OrderedDict()
+    for index, item in enumerate(items):
+        groups.setdefault(item.key, []).append(index)
+    return groups
+
+
+class BatchReport:
+    """Throughput of one batch."""
+
+    def __init__(self, num_items: int, num_keys: int, concurrency: int):
+        self.num_items = num_items
+        self.num_keys = num_keys
+        self.concurrency = concurrency
+        self.start = time.perf_counter()
+        self.succeeded = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.predicted_tokens = 0
+        self.slot_stats = self._slot_counters()
+
+    @staticmethod
+    def _slot_counters() -> dict:
+        counters = {"hits": 0, "misses": 0}
+        for backend in session_service.backend_pool.backends:
+            for name in counters:
+                counters[name] += getattr(backend.slot_pool, name)
+        return counters
+
+    def record(self, response_data: dict):
+        self.succeeded += 1
+        timings = response_data.get("timings") or {}
+        self.prompt_tokens += timings.get("prompt_n") or 0
+        self.cached_tokens += timings.get("cache_n") or 0
+        self.predicted_tokens += timings.get("predicted_n") or 0
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.start
+        slot_stats = self._slot_counters()
+        return {
+            "items": self.num_items,
+            "keys": self.num_keys,
+            "concurrency": self.concurrency,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed_s": elapsed,
+            "items_per_second": (self.succeeded + self.failed) / elapsed if elapsed else 0.0,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "predicted_tokens": self.predicted_tokens,
+            "predicted_tokens_per_second": self.predicted_tokens / elapsed if elapsed else 0.0,
+            # Slot residency during the batch (includes concurrent non-batch traffic)
+            "resident_hits": slot_stats["hits"] - self.slot_stats["hits"],
+            "restores": slot_stats["misses"] - self.slot_stats["misses"],
+        }
+
+
+async def run_batch(batch: BatchRequest):
+    """
+    Run the items of a batch and yield NDJSON lines as they finish.
+
+    Items for the same key run back to back in their original order, so the
+    session stays in its slot between them; up to `concurrency` keys run at
+    once, those with the most items first. The last line is the throughput
+    report.
+    """
+    items = batch.items
+    groups = group_by_key(items)
+    total_slots = sum(backend.slot_pool.num_slots for backend in session_service.backend_pool.backends)
+    concurrency = max(1, min(batch.concurrency or settings.batch_concurrency or total_slots, len(groups)))
+    report = BatchReport(len(items), len(groups), concurrency)
+    logger.info(f"Running batch of {len(items)} items for {len(groups)} keys, {concurrency} keys at a time")
+
+    # Keys with the most items first, so no long key is left running alone at the end
+    pending: asyncio.Queue = asyncio.Queue()
+    for key, indexes in sorted(groups.items(), key=lambda group: len(group[1]), reverse=True):
+        pending.put_nowait((key, indexes))
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                key, indexes = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            for index in indexes:
+                # Results are returned whole, streaming is not supported per item
+                request = {**items[index].request, "stream": False}
+                try:
+                    response_data = await session_service.complete(key, request)
+                    report.record(response_data)
+                    result = {"index": index, "key": key, "status": 200, "response": response_data}
+                except HTTPException as e:
+                    report.failed += 1
+                    result = {"index": index, "key": key, "status": e.status_code, "error": e.detail}
+                await results.put(result)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for _ in range(len(items)):
+            result = await results.get()
+            yield json.dumps(result) + "\n"
+        summary = report.summary()
+        logger.info(
+            f"Batch done: {summary['succeeded']} succeeded, {summary['failed']} failed in "
+            f"{summary['elapsed_s']:.2f}s ({summary['items_per_second']:.2f} items/s)"
+        )
+        yield json.dumps({"summary": summary}) + "\n"
+    finally:
+        # The client went away: stop scheduling items
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+@router.post("/completions")
+async def batch_completions(request: Request):
+    """
+    Run many {key, request} completions in one call.
+
+    Accepts {"items": [{"key": ..., "request": {...}}, ...], "concurrency": N}
+    as JSON, or one {"key", "request"} object per line with an NDJSON content
+    type. Streams one NDJSON line per item as it finishes ({"index", "key",
+    "status", "response" or "error"}), then {"summary": {...}} with the
+    throughput of the batch.
+    """
+    try:
+        batch = parse_batch(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    if len(batch.items) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch has {len(batch.items)} items, at most {settings.batch_max_items} are allowed"
+        )
+    return StreamingResponse(run_batch(batch), media_type="application/x-ndjson")
@@ -1,11 +1,22 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Header, Request, Response
 from pydantic import BaseModel
-import httpx
+import asyncio
 import subprocess
 import logging
 import os
 from pathlib import Path
+from typing import List, Optional, Sequence
 from app.config import settings
+from app import metrics
+from app.clients import backend_client
+from app.commit_cache import commit_cache
+from app.commit_db import commit_db, read_head
+from app.commit_index import commit_index
+from app.conversations import Conversation, conversation_store
+from app.response_cache import response_cache
+from app.git import render_commits, run_git
+from app.sessions import session_service
+from app.tokens import token_counter
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -17,102 +28,680 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Commits loaded at a time while filling a token budget
+BUDGET_BATCH_SIZE = 50
+
+# Seconds between checks whether the client of a /git/history request went away
+DISCONNECT_POLL_INTERVAL = 0.5
+
 # Data models
 class GitHistoryRequest(BaseModel):
     repo_path: str
     query: str
     num_commits: int = 10  # Default to 10 commits
+    layout: Optional[str] = None  # Prompt layout, defaults to settings.git_history_prompt_layout
+    token_budget: Optional[int] = None  # Fill this many prompt tokens instead of taking num_commits
+    top_k: Optional[int] = None  # Pick commits relevant to the query, defaults to settings.git_history_search_top_k
+    paths: Optional[List[str]] = None  # Only commits touching these paths (git pathspecs)
+    since: Optional[str] = None  # Only commits after this date, e.g. "2024-01-01" or "2 weeks ago"
+    until: Optional[str] = None  # Only commits before this date
+    author: Optional[str] = None  # Only commits whose author matches this pattern
+    rev_range: Optional[str] = None  # Revision range to take commits from instead of HEAD, e.g. "v1.0..main"
+    model: Optional[str] = None  # Model passed to the original server, part of the response cache key
+    incremental: Optional[bool] = None  # Continue the session's conversation, defaults to settings.git_history_incremental
+
+
+# Prompt layouts understood by format_git_history_request
+PROMPT_LAYOUTS = ("legacy", "prefix_stable")
+
+# Prompt tokens the original server reused from its cache vs evaluated
+prompt_cache_stats = {
+    "requests": 0,
+    "tokens_reused": 0,
+    "tokens_evaluated": 0,
+}
+
+
+def git_error(e: Exception) -> ValueError:
+    """Turn a failed git command into the ValueError reported to clients."""
+    if isinstance(e, subprocess.CalledProcessError):
+        logger.error(f"Git command failed: {e.stderr}")
+        return ValueError(f"Git command failed: {e.stderr}")
+    if isinstance(e, subprocess.TimeoutExpired):
+        logger.error(f"Git command timed out: {e.cmd}")
+        return ValueError(f"Git command timed out after {e.timeout} seconds")
+    logger.error(f"Error extracting git history: {str(e)}")
+    return ValueError(f"Error extracting git history: {str(e)}")
+
+
+def history_scope(request: GitHistoryRequest) -> List[str]:
+    """
+    git arguments that restrict the history to the scope of a request.
+
+    Returns:
+        Filter options, the revision range and pathspecs after "--", or an
+        empty list for the whole history of HEAD
+
+    Raises:
+        ValueError: rev_range is not a revision range
+    """
+    options = []
+    if request.since:
+        options.append(f"--since={request.since}")
+    if request.until:
+        options.append(f"--until={request.until}")
+    if request.author:
+        options.append(f"--author={request.author}")
+    if request.rev_range and (request.rev_range.startswith("-") or any(c.isspace() for c in request.rev_range)):
+        raise ValueError(f"Invalid revision range: {request.rev_range}")
+    if not options and not request.rev_range and not request.paths:
+        return []
+    scope = [*options, request.rev_range or "HEAD"]
+    if request.paths:
+        scope += ["--", *request.paths]
+    return scope
+
+
+async def list_commit_hashes(repo_path: str, num_commits: int, scope: Sequence[str] = ()):
+    """Hashes of the last num_commits commits in scope (see history_scope), newest first."""
+    if not os.path.isdir(repo_path):
+        raise ValueError(f"Repository path does not exist: {repo_path}")
+    if not scope:
+        commit_hashes = await commit_db.commit_hashes(repo_path, num_commits)
+        if commit_hashes is not None:
+            return commit_hashes
+    output = await run_git(repo_path, "log", f"-{num_commits}", "--format=%H", *scope)
+    return [h for h in output.split("\n") if h]
+
+
+async def load_commits(repo_path: str, commit_hashes):
+    """
+    Commit details for the given hashes, rendering only the commits that are
+    neither in the commit cache nor in the commit database.
+    """
+    contents = await commit_cache.get_many(repo_path, commit_hashes)
+    missing = [h for h in commit_hashes if h not in contents]
+    if missing:
+        stored = await commit_db.get_many(repo_path, missing)
+        contents.update({commit_hash: commit["content"] for commit_hash, commit in stored.items()})
+        missing = [h for h in missing if h not in contents]
+    if missing:
+        rendered = await render_commits(repo_path, missing)
+        await commit_cache.put_many(repo_path, list(rendered.items()))
+        contents.update(rendered)
+
+    commits = []
+    for commit_hash in commit_hashes:
+        commits.append({
+            "hash": commit_hash,
+            # Short hash (8 symbols)
+            "short_hash": commit_hash[:8],
+            "content": contents[commit_hash]
+        })
+    return commits
 
 
-async def get_git_history(repo_path: str, num_commits: int = 10):
+async def get_git_history(repo_path: str, num_commits: int = 10, scope: Sequence[str] = ()):
     """
     Extract git history from a repository with detailed information.
+
+    Lists the last commits from the commit database, or with
+    `git log --format=%H` when it is not enabled, takes the ones that were
+    rendered before from the commit cache or database and renders only the
+    rest with a single streamed `git log -p`. git runs as an asyncio
+    subprocess, so the event loop keeps serving other requests meanwhile.
+    A scope is passed to `git log`, so only matching commits are listed.
     
     Args:
         repo_path: Path to the git repository
         num_commits: Number of recent commits to extract
+        scope: git arguments from history_scope, empty for the history of HEAD
         
     Returns:
         List of commit details including hash, short hash and content
     """
     try:
-        # Change to the repository directory
-        if not os.path.isdir(repo_path):
-            raise ValueError(f"Repository path does not exist: {repo_path}")
-        
-        # Get the last N commit hashes
-        cmd = ["git", "-C", repo_path, "log", f"-{num_commits}", "--format=%H"]
-        process = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        commit_hashes = process.stdout.strip().split('\n')
-        
-        # Get detailed information for each commit
-        commits = []
-        for commit_hash in commit_hashes:
-            if not commit_hash:  # Skip empty lines
-                continue
-                
-            # Get short hash (8 symbols)
-            short_hash = commit_hash[:8]
-            
-            # Get detailed commit info using git show
-            cmd = ["git", "-C", repo_path, "show", commit_hash]
-            process = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            commit_content = process.stdout
-            
-            commits.append({
-                "hash": commit_hash,
-                "short_hash": short_hash,
-                "content": commit_content
-            })
-            
-        return commits
-        
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Git command failed: {e.stderr}")
-        raise ValueError(f"Git command failed: {e.stderr}")
+        commit_hashes = await list_commit_hashes(repo_path, num_commits, scope)
+        return await load_commits(repo_path, commit_hashes)
+    except ValueError:
+        raise
     except Exception as e:
-        logger.error(f"Error extracting git history: {str(e)}")
-        raise ValueError(f"Error extracting git history: {str(e)}")
+        raise git_error(e)
 
 
-async def format_git_history_request(commits, query):
+def summarize_commit(content: str) -> str:
+    """
+    Reduce a rendered commit to its header and a per-file stat of the diff.
+
+    Used for commits too large to include in full.
+    """
+    header, separator, diff = content.partition("\ndiff --")
+    if not separator:
+        return content
+
+    files = []
+    added = removed = 0
+    columns = 1  # Prefix width: 1 for normal diffs, one per parent for combined diffs
+    for line in f"diff --{diff}".split("\n"):
+        if line.startswith("diff --git "):
+            files.append([line.rsplit(" b/", 1)[-1], 0, 0])
+            columns = 1
+        elif line.startswith("diff --cc ") or line.startswith("diff --combined "):
+            files.append([line.split(" ", 2)[-1], 0, 0])
+            columns = 2
+        elif line.startswith("@@@"):
+            columns = len(line) - len(line.lstrip("@")) - 1
+        elif not files or line.startswith("+++ ") or line.startswith("--- "):
+            continue
+        elif "+" in line[:columns]:
+            files[-1][1] += 1
+            added += 1
+        elif "-" in line[:columns]:
+            files[-1][2] += 1
+            removed += 1
+
+    stat = "\n".join(f" {path} | +{plus} -{minus}" for path, plus, minus in files)
+    return (
+        f"{header.rstrip()}\n\n"
+        f"[Diff omitted, {len(files)} files changed, "
+        f"{added} insertions(+), {removed} deletions(-)]\n"
+        f"{stat}\n"
+    )
+
+
+async def select_commits_by_budget(
+    repo_path: str,
+    token_budget: int,
+    reserved_tokens: int = 0,
+    commit_hashes: Optional[list] = None,
+    scope: Sequence[str] = (),
+):
+    """
+    Pick the most recent commits that fit into a token budget.
+
+    Commits are taken newest first (or in the given order) until the budget
+    is used up. Commits above the per-commit limit, or that do not fit in
+    full, are reduced to their header and file stat. Token counts are cached
+    per commit.
+
+    Args:
+        repo_path: Path to the git repository
+        token_budget: Prompt tokens available for the whole message
+        reserved_tokens: Tokens already used by instructions and query
+        commit_hashes: Candidate commits in order of preference, default: the most recent
+        scope: git arguments from history_scope for the most recent commits
+
+    Returns:
+        List of commit details, in the order of the candidates
+    """
+    if commit_hashes is None:
+        try:
+            commit_hashes = await list_commit_hashes(repo_path, settings.git_history_max_commits, scope)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise git_error(e)
+
+    remaining = token_budget - reserved_tokens
+    commit_limit = settings.git_history_max_commit_tokens or token_budget // 4
+    selected = []
+
+    for start in range(0, len(commit_hashes), BUDGET_BATCH_SIZE):
+        try:
+            batch = await load_commits(repo_path, commit_hashes[start:start + BUDGET_BATCH_SIZE])
+        except Exception as e:
+            raise git_error(e)
+        counts = await token_counter.count_many(
+            [commit_text(commit) for commit in batch],
+            [commit["hash"] for commit in batch]
+        )
+        for commit, tokens in zip(batch, counts):
+            if tokens > commit_limit or tokens > remaining:
+                summary = {**commit, "content": summarize_commit(commit["content"])}
+                tokens = await token_counter.count(commit_text(summary), f"{commit['hash']}:summary")
+                commit = summary
+            if tokens > remaining:
+                logger.info(f"Token budget {token_budget} filled with {len(selected)} commits")
+                return selected
+            selected.append(commit)
+            remaining -= tokens
+
+    return selected
+
+
+async def search_commits(repo_path: str, query: str, top_k: int, scope: Sequence[str] = ()):
+    """
+    Find the commits most relevant to a query in the whole history, or in
+    the commits in scope.
+
+    Brings the repository's commit index up to date (only commits that were
+    not indexed yet are rendered) and searches it. When fewer than top_k
+    commits match the query, the most recent other commits fill the rest.
+
+    Args:
+        repo_path: Path to the git repository
+        query: User's text query
+        top_k: Number of commits to return
+        scope: git arguments from history_scope
+
+    Returns:
+        Tuple of the matching commit hashes, best first, and all searched
+        commit hashes, newest first
+    """
+    try:
+        commit_hashes = await list_commit_hashes(repo_path, settings.commit_index_max_commits, scope)
+        await commit_index.update(repo_path, commit_hashes, render_commits)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise git_error(e)
+    ranked = await commit_index.search(repo_path, query, top_k, commit_hashes)
+    matched = len(ranked)
+    if matched < top_k:
+        picked = set(ranked)
+        ranked += [h for h in commit_hashes if h not in picked][:top_k - matched]
+    logger.info(f"Commit search picked {len(ranked)} of {len(commit_hashes)} commits ({matched} matching the query)")
+    return ranked, commit_hashes
+
+
+async def count_commits(repo_path: str, scope: Sequence[str] = ()) -> int:
+    """Number of commits reachable from HEAD, or in scope."""
+    if not scope:
+        total_commits = await commit_db.count_commits(repo_path)
+        if total_commits is not None:
+            return total_commits
+    try:
+        output = await run_git(repo_path, "rev-list", "--count", *(scope or ["HEAD"]))
+        return int(output.strip())
+    except Exception as e:
+        raise git_error(e)
+
+
+def anchored_window(total_commits: int, num_commits: int) -> int:
+    """
+    Number of recent commits to show so the oldest one rarely changes.
+
+    A plain "last N commits" window drops its oldest commit whenever a new
+    one arrives, which changes the start of the prompt. Instead the window
+    starts at a multiple of num_commits (counting from the first commit) and
+    grows until it holds 2 * num_commits - 1 commits, then moves forward.
+
+    Args:
+        total_commits: Number of commits in the repository
+        num_commits: Requested number of commits
+
+    Returns:
+        Number of recent commits to show, between num_commits and 2 * num_commits - 1
+    """
+    if num_commits <= 0 or total_commits <= num_commits:
+        return num_commits
+    start = (total_commits - num_commits) // num_commits * num_commits
+    return total_commits - start
+
+
+def commit_text(commit) -> str:
+    """Text of one commit as it appears in the prompt."""
+    return (
+        f"Commit: {commit['hash']}\n"
+        f"Short hash: {commit['short_hash']}\n"
+        f"{commit['content']}"
+    )
+
+
+async def format_git_history_request(commits, query, layout: str = "legacy"):
     """
     Format the git history and query into a request message.
+
+    The legacy layout starts with the number of commits and lists them
+    newest first. The prefix_stable layout starts with fixed instructions,
+    lists commits oldest first and puts the query last, so new commits only
+    extend the prompt the original server has already cached.
     
     Args:
-        commits: List of commit details
+        commits: List of commit details, newest first
         query: User's text query
+        layout: One of PROMPT_LAYOUTS
         
     Returns:
         Formatted message to send to the Session Management Service
     """
-    commit_text = "\n\n".join([
-        f"Commit: {commit['hash']}\n"
-        f"Short hash: {commit['short_hash']}\n"
-        f"{commit['content']}"
-        for commit in commits
-    ])
+    if layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unknown prompt layout: {layout}")
+
+    if layout == "prefix_stable":
+        commits = list(reversed(commits))
+
+    commits_text = "\n\n".join([commit_text(commit) for commit in commits])
     
+    if layout == "prefix_stable":
+        return (
+            f"You are given commits of a repository, oldest first, and a request at the end. "
+            f"Return the most relevant commit ids for engineer to study to better "
+            f"understand the codebase and request.\n\n"
+            f"RETURN ONLY REFERENCES: commit_ids, filenames and important symbols/functions. DO NOT implement anything yourself.\n\n"
+            f"FOCUS ON BREVITY, DEVELOPER WILL BE ABLE TO LOOK AT REFERENCES THEMSELVES\n\n"
+            f"{commits_text}\n\n"
+            f"Request: {query}"
+        )
+
     message = (
         f"You are given last {len(commits)} commits and a request at the end. "
         f"Return the most relevant commit ids for engineer to study to better "
         f"understand the codebase and request.\n\n"
         f"RETURN ONLY REFERENCES: commit_ids, filenames and important symbols/functions. DO NOT implement anything yourself.\n\n"
         f"FOCUS ON BREVITY, DEVELOPER WILL BE ABLE TO LOOK AT REFERENCES THEMSELVES"
-        f"{commit_text}\n\n"
+        f"{commits_text}\n\n"
         f"Request: {query}"
     )
     
     return message
 
 
+def split_unseen_commits(commits, seen):
+    """
+    Split the commits a conversation has not seen into newer and older ones.
+
+    Commits ahead of the newest seen commit in the list were added since;
+    the others are older history picked this time (by search, a larger
+    window, another scope or budget). Without a seen commit in the list the
+    age of the commits is unknown, so all of them count as older.
+
+    Args:
+        commits: List of commit details, newest first
+        seen: Hashes of the commits the conversation contains
+
+    Returns:
+        Tuple of the newer and the older unseen commits, newest first
+    """
+    first_seen = next((i for i, commit in enumerate(commits) if commit["hash"] in seen), None)
+    if first_seen is None:
+        return [], list(commits)
+    newer = commits[:first_seen]
+    older = [commit for commit in commits[first_seen:] if commit["hash"] not in seen]
+    return newer, older
+
+
+def format_follow_up(newer, older, query):
+    """
+    Format a follow-up turn with the commits the session has not seen yet.
+
+    Args:
+        newer: Commits added since the commits shown before, newest first
+        older: Earlier commits that were not shown before, newest first
+        query: User's text query
+
+    Returns:
+        Message that continues the conversation
+    """
+    parts = []
+    if newer:
+        commits_text = "\n\n".join([commit_text(commit) for commit in reversed(newer)])
+        parts.append(f"{len(newer)} commits were added after the commits shown before, oldest first.\n\n{commits_text}")
+    if older:
+        commits_text = "\n\n".join([commit_text(commit) for commit in reversed(older)])
+        parts.append(f"{len(older)} earlier commits that were not shown before, oldest first.\n\n{commits_text}")
+    if not parts:
+        parts.append("There are no commits that were not shown before.")
+    return "\n\n".join(parts) + f"\n\nRequest: {query}"
+
+
+def reply_text(response_data: dict) -> Optional[str]:
+    """Assistant message of a chat completion, None if there is none."""
+    try:
+        content = response_data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+    return content if isinstance(content, str) else None
+
+
+def record_prompt_cache(session_key: str, response_data: dict):
+    """Log and count how much of the prompt the original server took from its cache."""
+    timings = response_data.get("timings") or {}
+    reused = timings.get("cache_n")
+    evaluated = timings.get("prompt_n")
+    if reused is None or evaluated is None:
+        return
+
+    prompt_cache_stats["requests"] += 1
+    prompt_cache_stats["tokens_reused"] += reused
+    prompt_cache_stats["tokens_evaluated"] += evaluated
+    logger.info(
+        f"Prompt cache for {session_key}: reused {reused} tokens, "
+        f"evaluated {evaluated} tokens"
+    )
+
+
+async def send_over_http(sms_request: dict) -> dict:
+    """
+    POST a request to the Session Management Service over HTTP.
+
+    Only used with GIT_HISTORY_DISPATCH=http, for deployments where the
+    session service runs in a separate process.
+    """
+    url = settings.session_service_url or f"http://{settings.host}:{settings.port}"
+    url = f"{url}/v1/chat/completions"
+    
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": "Bearer no-key"
+    }
+    
+    response = await backend_client.client.post(
+        url,
+        json=sms_request,
+        headers=headers
+    )
+    
+    if response.status_code != 200:
+        logger.error(f"Error from Session Management Service: {response.text}")
+        raise HTTPException(
+            status_code=response.status_code,
+            detail="Request to Session Management Service failed"
+        )
+    
+    # Return response from the Session Management Service
+    return response.json()
+
+
+async def query_git_history(request: GitHistoryRequest, session_key: str, layout: str, incremental: bool):
+    """
+    Extract the commits for a /git/history request, send them with the query
+    and return the completion.
+
+    With incremental set, a query for a session that already has a
+    conversation is sent as a follow-up turn after the previous messages and
+    replies, with only the commits the conversation does not contain yet.
+    The earlier turns are resent unchanged, so the original server takes them
+    from the session's prompt cache and only evaluates the new turn.
+
+    Args:
+        request: GitHistoryRequest containing repo path and query
+        session_key: Session of the repository
+        layout: One of PROMPT_LAYOUTS
+        incremental: Continue the conversation of the session
+
+    Returns:
+        Response of the Session Management Service
+    """
+    # Invalid requests must not touch the stored conversation
+    if layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unknown prompt layout: {layout}")
+    top_k = settings.git_history_search_top_k if request.top_k is None else request.top_k
+    scope = history_scope(request)
+    
+    # Extract git history
+    with metrics.git_extraction_seconds.time():
+        if top_k:
+            ranked, commit_hashes = await search_commits(request.repo_path, request.query, top_k, scope)
+            if request.token_budget:
+                frame = await format_git_history_request([], request.query, layout)
+                commits = await select_commits_by_budget(
+                    request.repo_path, request.token_budget, token_counter.estimate(frame), ranked
+                )
+            else:
+                try:
+                    commits = await load_commits(request.repo_path, ranked)
+                except Exception as e:
+                    raise git_error(e)
+            # Back to history order, newest first
+            position = {commit_hash: i for i, commit_hash in enumerate(commit_hashes)}
+            commits.sort(key=lambda commit: position[commit["hash"]])
+        elif request.token_budget:
+            # Instructions and query take part of the budget
+            frame = await format_git_history_request([], request.query, layout)
+            commits = await select_commits_by_budget(
+                request.repo_path, request.token_budget, token_counter.estimate(frame), scope=scope
+            )
+        else:
+            num_commits = request.num_commits
+            if layout == "prefix_stable":
+                total_commits = await count_commits(request.repo_path, scope)
+                num_commits = anchored_window(total_commits, num_commits)
+            commits = await get_git_history(request.repo_path, num_commits, scope)
+    
+    # Only once the commits were extracted, a mismatch resets the conversation
+    conversation = conversation_store.get(session_key, request.repo_path, layout) if incremental else None
+    message = None
+    if conversation is not None:
+        newer, older = split_unseen_commits(commits, conversation.commits)
+        new_commits = newer + older
+        message = format_follow_up(newer, older, request.query)
+        # The whole conversation is resent, so it has to fit the budget and the conversation limit
+        limits = [limit for limit in (request.token_budget, conversation_store.max_tokens) if limit]
+        if limits and conversation.tokens + token_counter.estimate(message) > min(limits):
+            logger.info(f"Starting a new conversation for {session_key}: token limit exceeded")
+            conversation_store.reset(session_key)
+            conversation = None
+            message = None
+        else:
+            conversation_store.follow_ups += 1
+            conversation_store.commits_skipped += len(commits) - len(new_commits)
+            commits = new_commits
+    
+    # Format message
+    if message is None:
+        message = await format_git_history_request(commits, request.query, layout)
+    history = conversation.messages if conversation is not None else []
+    
+    # Prepare request to the Session Management Service
+    sms_request = {
+        "key": session_key,
+        "request": {
+            "messages": history + [
+                {
+                    "role": "user",
+                    "content": message
+                }
+            ]
+        }
+    }
+    if request.model:
+        sms_request["request"]["model"] = request.model
+    
+    # Send request to the Session Management Service
+    try:
+        if settings.git_history_dispatch == "http":
+            response_data = await send_over_http(sms_request)
+        else:
+            response_data = await session_service.complete(session_key, sms_request["request"])
+    except Exception:
+        if conversation is not None:
+            # E.g. the conversation outgrew the context: the next query starts over
+            logger.info(f"Starting a new conversation for {session_key}: request failed")
+            conversation_store.reset(session_key)
+        raise
+    
+    record_prompt_cache(session_key, response_data)
+    
+    if incremental:
+        reply = reply_text(response_data)
+        if reply is None:
+            # Without the reply the next prompt would not extend this one
+            conversation_store.reset(session_key)
+        else:
+            conversation = conversation or Conversation(request.repo_path, layout)
+            conversation.add_turn(message, reply, [commit["hash"] for commit in commits])
+            conversation_store.put(session_key, conversation)
+    return response_data
+
+
+async def response_cache_key(request: GitHistoryRequest, layout: str, top_k: int):
+    """
+    Cache key of the answer to a request.
+
+    Resolves HEAD (from the ref files when possible) and the revision range,
+    so the key changes whenever the history the answer is based on changes.
+
+    Returns:
+        Tuple of the repository, its HEAD and the cache key
+    """
+    repo = os.path.realpath(request.repo_path)
+    if not os.path.isdir(repo):
+        raise ValueError(f"Repository path does not exist: {request.repo_path}")
+    scope = history_scope(request)
+    try:
+        head = read_head(repo) or (await run_git(repo, "rev-parse", "HEAD")).strip()
+        revisions = (await run_git(repo, "rev-parse", request.rev_range)).split() if request.rev_range else []
+    except Exception as e:
+        raise git_error(e)
+    params = {
+        "num_commits": request.num_commits,
+        "token_budget": request.token_budget,
+        "layout": layout,
+        "top_k": top_k,
+        "scope": scope,
+        "revisions": revisions,
+    }
+    return repo, head, response_cache.make_key(repo, head, request.query, params, request.model or "")
+
+
+async def cancel_on_disconnect(http_request: Request, work):
+    """
+    Await work, cancelling it if the client disconnects first.
+
+    Cancelling closes the request to the original server, which then stops
+    generating an answer nobody will read.
+
+    Raises:
+        HTTPException: 499 if the client disconnected
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling git history request")
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
 @router.post("/history")
-async def analyze_git_history(request: GitHistoryRequest):
+async def analyze_git_history(
+    request: GitHistoryRequest,
+    response: Response,
+    http_request: Request,
+    cache_control: Optional[str] = Header(None),
+):
     """
     Analyze git history and send the analysis to the Session Management Service.
+
+    The completion runs in-process through the shared SessionService, or
+    over HTTP with GIT_HISTORY_DISPATCH=http. Answers are cached until HEAD
+    moves; the X-Cache header tells whether the answer came from the cache
+    (HIT, with its Age) or the backend (MISS). `Cache-Control: no-cache`
+    skips the cached answer and replaces it. If the client disconnects
+    before the answer is ready, the request is cancelled.
     
     Args:
         request: GitHistoryRequest containing repo path and query
+        response: Response whose cache headers are set
+        http_request: Incoming request, to notice when the client disconnects
+        cache_control: Cache-Control request header
         
     Returns:
         A status response indicating if the request was successful
@@ -122,50 +711,32 @@ async def analyze_git_history(request: GitHistoryRequest):
         repo_name = Path(request.repo_path).name
         session_key = f"{repo_name}_git_history"
         
-        # Extract git history
-        commits = await get_git_history(request.repo_path, request.num_commits)
+        layout = request.layout or settings.git_history_prompt_layout
+        incremental = settings.git_history_incremental if request.incremental is None else request.incremental
         
-        # Format message
-        message = await format_git_history_request(commits, request.query)
-        
-        # Prepare request to the Session Management Service
-        sms_request = {
-            "key": session_key,
-            "request": {
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": message
-                    }
-                ]
-            }
-        }
+        async def answer():
+            if incremental:
+                # Turns of a conversation are sent one at a time
+                async with conversation_store.lock(session_key):
+                    return await query_git_history(request, session_key, layout, incremental)
+            return await query_git_history(request, session_key, layout, incremental)
         
-        # Send request to the Session Management Service
-        url = f"http://{settings.host}:{settings.port}/v1/chat/completions"
+        if not response_cache.enabled:
+            return await cancel_on_disconnect(http_request, answer())
         
-        async with httpx.AsyncClient(timeout=settings.original_server_timeout) as client:
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": "Bearer no-key"
-            }
-            
-            response = await client.post(
-                url,
-                json=sms_request,
-                headers=headers
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Error from Session Management Service: {response.text}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Request to Session Management Service failed"
-                )
-            
-            # Return response from the Session Management Service
-            return response.json()
+        top_k = settings.git_history_search_top_k if request.top_k is None else request.top_k
+        repo, head, cache_key = await response_cache_key(request, layout, top_k)
+        refresh = "no-cache" in (cache_control or "").lower()
+        response_data, status, age = await cancel_on_disconnect(
+            http_request, response_cache.get_or_compute(cache_key, repo, head, answer, refresh)
+        )
+        response.headers["X-Cache"] = status
+        if status == "HIT":
+            response.headers["Age"] = str(int(age))
+        return response_data
             
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
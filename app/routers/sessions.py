@@ -0,0 +1,93 @@
+from fastapi import APIRouter, HTTPException
+import logging
+from app.session_store import session_store
+from app.sessions import session_service
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Create router
+router = APIRouter(
+    prefix="/admin/sessions",
+    tags=["admin"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+def residency(key: str):
+    """Slots the session for key is loaded into."""
+    return [
+        {
+            "backend": backend.url,
+            "slot": slot.id,
+            "dirty": slot.dirty,
+            "busy": slot.busy,
+            "save_pending": slot.save_pending,
+        }
+        for backend, slot in session_service.backend_pool.residency(key)
+    ]
+
+
+@router.get("")
+async def list_sessions():
+    """
+    List the session files, most recently used first.
+    
+    Returns:
+        Session store statistics and the size and last access of every session
+    """
+    if not session_store.enabled:
+        raise HTTPException(status_code=404, detail="Session store is not configured (SESSION_DIR)")
+    return {
+        **session_store.stats(),
+        "items": [
+            {**info, "in_use": session_service.session_in_use(info["key"])}
+            for info in session_store.list_sessions()
+        ],
+    }
+
+
+@router.get("/{key}")
+async def get_session(key: str):
+    """
+    Inspect one session.
+    
+    Returns:
+        Size and last access of the session file, the slots it is loaded into
+        and the number of requests for it that are running or waiting
+    """
+    info = session_store.info(key)
+    slots = residency(key)
+    if info is None and not slots:
+        raise HTTPException(status_code=404, detail=f"Session not found: {key}")
+    return {
+        "key": key,
+        "file": info,
+        "slots": slots,
+        "requests": session_service.key_scheduler.depth(key),
+    }
+
+
+@router.delete("/{key}")
+async def delete_session(key: str):
+    """
+    Delete a session: its file and any copy loaded into a slot.
+    
+    Sessions with running or waiting requests, or with a save in progress,
+    cannot be deleted.
+    """
+    if not session_store.enabled:
+        raise HTTPException(status_code=404, detail="Session store is not configured (SESSION_DIR)")
+    if not session_service.drop_session(key):
+        raise HTTPException(status_code=409, detail=f"Session is in use: {key}")
+    try:
+        size = await session_store.delete(key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        logger.error(f"Error deleting session {key}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if size is None:
+        raise HTTPException(status_code=404, detail=f"Session not found: {key}")
+    logger.info(f"Deleted session for key: {key}")
+    return {"key": key, "deleted_bytes": size}
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from app.backends import Backend
+from app.slots import Slot
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class SessionSaver:
+    """
+    Write-behind queue for session saves.
+
+    Saves are taken off the response path and run by background workers. A
+    slot with a queued save is not handed to other keys until the save has
+    finished, so its KV cache cannot be overwritten before it is on disk.
+    Requests for the same key may keep using the slot meanwhile; their saves
+    are merged into the one already queued. A failed save leaves the slot
+    dirty, so it is saved again before the slot is handed to another key.
+    """
+
+    def __init__(self, save: Callable[[Backend, Slot], Awaitable[None]], num_workers: int = 1):
+        """
+        Args:
+            save: Coroutine function that saves the session of a leased slot,
+                raising if the original server did not save it
+            num_workers: Number of saves that may run at the same time
+        """
+        self.save = save
+        self.num_workers = num_workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self.submitted = 0
+        self.merged = 0
+        self.saved = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the background workers."""
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.num_workers)
+        ]
+
+    def submit(self, backend: Backend, slot: Slot):
+        """Queue a save of the session in a slot of backend, merging with a save already queued."""
+        self.submitted += 1
+        if slot.save_pending:
+            self.merged += 1
+            return
+        slot.save_pending = True
+        self._queue.put_nowait((backend, slot))
+
+    async def _worker(self):
+        while True:
+            backend, slot = await self._queue.get()
+            try:
+                async with backend.slot_pool.lease_slot(slot):
+                    try:
+                        await self.save(backend, slot)
+                        self.saved += 1
+                    finally:
+                        # Cleared before the lease is released so waiters see it
+                        slot.save_pending = False
+            except Exception as e:
+                self.failed += 1
+                logger.error(
+                    f"Background save of slot {slot.id} on {backend.url} failed, "
+                    f"keeping it dirty: {str(e)}"
+                )
+            finally:
+                self._queue.task_done()
+
+    async def drain(self, timeout: float):
+        """Wait for queued saves to finish, then stop the workers."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Gave up waiting for {self._queue.qsize()} pending session saves")
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    def stats(self) -> dict:
+        """Queue length and save counters."""
+        return {
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "submitted": self.submitted,
+            "merged": self.merged,
+            "saved": self.saved,
+            "failed": self.failed,
+        }
@@ -0,0 +1,541 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app import metrics
+from app.codecs import CODECS, Codec, codec_for_suffix, get_codec
+from app.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class Tier:
+    """
+    Session files of one directory, least recently used first.
+
+    New files get suffix; files with any of the other known suffixes are
+    indexed too, so they can still be read and deleted.
+    """
+
+    def __init__(self, name: str, directory: str, suffix: str, other_suffixes: Iterable[str] = ()):
+        self.name = name
+        self.directory = directory
+        self.suffix = suffix
+        self.suffixes = [suffix] + [other for other in other_suffixes if other != suffix]
+        # key -> (size, last access)
+        self.sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self.file_suffixes: Dict[str, str] = {}  # Key -> suffix of its file
+        self.bytes = 0
+
+    def path(self, key: str, suffix: Optional[str] = None) -> str:
+        """File of the session for key, with the suffix of its indexed file by default."""
+        filename = f"{key}{suffix or self.file_suffixes.get(key, self.suffix)}"
+        if os.path.basename(filename) != filename:
+            raise ValueError(f"Invalid session key: {key}")
+        return os.path.join(self.directory, filename)
+
+    def scan(self) -> Dict[str, tuple]:
+        """
+        Read the sizes, modification times and suffixes of the files
+        (blocking). Of several files of a key, the newest is used.
+        """
+        sessions = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return sessions
+        for entry in entries:
+            suffix = next((suffix for suffix in self.suffixes if entry.name.endswith(suffix)), None)
+            if suffix is None or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            key = entry.name[:-len(suffix)]
+            if key not in sessions or sessions[key][1] < stat.st_mtime:
+                sessions[key] = (stat.st_size, stat.st_mtime, suffix)
+        return sessions
+
+    def load(self, sessions: Dict[str, tuple]):
+        """Replace the index, keeping newer access times recorded in memory."""
+        entries = {}
+        for key, (size, mtime, _) in sessions.items():
+            known = self.sessions.get(key)
+            entries[key] = (size, known[1] if known is not None and known[1] > mtime else mtime)
+        self.sessions = OrderedDict(sorted(entries.items(), key=lambda item: item[1][1]))
+        self.file_suffixes = {key: suffix for key, (_, _, suffix) in sessions.items()}
+        self.bytes = sum(size for size, _ in self.sessions.values())
+
+    def update(self, key: str, size: int, last_access: float, suffix: Optional[str] = None):
+        self.forget(key)
+        self.sessions[key] = (size, last_access)
+        self.file_suffixes[key] = suffix or self.suffix
+        self.bytes += size
+
+    def forget(self, key: str) -> int:
+        self.file_suffixes.pop(key, None)
+        previous = self.sessions.pop(key, None)
+        if previous is None:
+            return 0
+        self.bytes -= previous[0]
+        return previous[0]
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "bytes": self.bytes,
+        }
+
+
+class SessionStore:
+    """
+    Lifecycle of the session files written by the original servers.
+
+    Every key leaves a {key}.bin KV-cache dump in the slot save directory
+    (the hot tier). The store tracks the size and last access of each file
+    (restores and saves count as access, and are written to the file mtime
+    so they survive restarts) and deletes the least recently used sessions
+    when the directory exceeds its byte quota, or sessions not used for
+    longer than the TTL. Sessions that are in use are never deleted.
+
+    With a cold directory, idle sessions and sessions pushed out by the quota
+    are compressed into the cold tier instead of being deleted, and moved
+    back into the hot tier before they are restored.
+
+    Both the move back and, for sessions already in the hot tier, reading
+    the file into the page cache start when a request arrives. They overlap
+    with the time the request waits for its turn and a slot, and the
+    original server then restores from the page cache instead of the disk.
+    """
+
+    def __init__(self, directory: Optional[str], max_bytes: int = 0, ttl: float = 0,
+                 cold_dir: Optional[str] = None, cold_max_bytes: int = 0, cold_after: float = 0,
+                 compression: str = "zstd", compression_workers: int = 2, read_ahead: bool = True):
+        """
+        Args:
+            directory: Slot save directory of the original servers, None to disable
+            max_bytes: Size limit of the hot session files, 0 for no limit
+            ttl: Seconds after the last access a session is deleted, 0 to keep it
+            cold_dir: Directory of compressed sessions, None for no cold tier
+            cold_max_bytes: Size limit of the cold tier, 0 for no limit
+            cold_after: Seconds after the last access a session is compressed,
+                0 to compress only sessions pushed out by max_bytes
+            compression: Codec of the cold tier ("zstd", "lz4" or "gzip")
+            compression_workers: Threads compressing and decompressing sessions
+            read_ahead: Read hot session files into the page cache on prefetch
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cold_dir = cold_dir if directory else None
+        self.cold_max_bytes = cold_max_bytes
+        self.cold_after = cold_after
+        self.compression = compression
+        self.compression_workers = compression_workers
+        self.read_ahead = read_ahead
+        self.hot = Tier("hot", directory, ".bin")
+        self.cold: Optional[Tier] = None
+        self._codec: Optional[Codec] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_use: Callable[[str], bool] = lambda key: False
+        self._lock = asyncio.Lock()
+        # Per-key locks of moves between the tiers, with the number of holders
+        self._moves: Dict[str, list] = {}
+        self._promotions: Dict[str, asyncio.Task] = {}
+        self._read_aheads: Dict[str, asyncio.Task] = {}
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._evict_task: Optional[asyncio.Task] = None  # Quota enforcement started by a save
+        self.evicted_quota = 0
+        self.evicted_ttl = 0
+        self.deleted = 0
+        self.promoted = 0
+        self.demoted = 0
+        self.read_aheads = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def path(self, key: str) -> str:
+        """File of the session for key in the hot tier."""
+        return self.hot.path(key)
+
+    async def start(self, in_use: Callable[[str], bool], sweep_interval: float = 60.0):
+        """
+        Index the session directories and start the periodic sweep.
+
+        Args:
+            in_use: Tells whether the session for a key must not be deleted or compressed
+            sweep_interval: Seconds between quota, TTL and compression checks
+        """
+        self._in_use = in_use
+        if not self.enabled:
+            return
+        if self.cold_dir:
+            self._codec = get_codec(self.compression)
+            # Files written with another codec, e.g. before SESSION_COMPRESSION changed
+            self.cold = Tier(
+                "cold", self.cold_dir, f".bin{self._codec.suffix}",
+                [f".bin{codec.suffix}" for codec in CODECS.values()],
+            )
+            os.makedirs(self.cold_dir, exist_ok=True)
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.compression_workers, thread_name_prefix="session-codec"
+            )
+        await self._rescan()
+        logger.info(
+            f"Session store indexed {len(self.hot.sessions)} sessions, "
+            f"{self.hot.bytes} bytes in {self.directory}"
+            + (f", {len(self.cold.sessions)} compressed sessions, {self.cold.bytes} bytes "
+               f"in {self.cold_dir} ({self._codec.name})" if self.cold else "")
+        )
+        if sweep_interval > 0 and (self.max_bytes or self.ttl or self.cold_after or self.cold_max_bytes):
+            self._sweep_task = asyncio.create_task(self._sweep_loop(sweep_interval))
+
+    async def stop(self):
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        if self._evict_task is not None:
+            await asyncio.gather(self._evict_task, return_exceptions=True)
+            self._evict_task = None
+        for task in list(self._promotions.values()) + list(self._read_aheads.values()):
+            await asyncio.gather(task, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def _rescan(self):
+        """Pick up files written or removed by others, e.g. instances sharing the directory."""
+        self.hot.load(await asyncio.to_thread(self.hot.scan))
+        if self.cold:
+            self.cold.load(await asyncio.to_thread(self.cold.scan))
+
+    @asynccontextmanager
+    async def _moving(self, key: str):
+        """Hold the lock of key for a move between the tiers."""
+        entry = self._moves.get(key)
+        if entry is None:
+            entry = self._moves[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._moves[key]
+
+    async def _run(self, func, *args):
+        """Run blocking (de)compression in the codec thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _touch(path: str, now: float) -> int:
+        os.utime(path, (now, now))
+        return os.path.getsize(path)
+
+    def prefetch(self, key: str):
+        """
+        Start getting the session for key ready for a restore, without
+        waiting for it: move it back into the hot tier if it is compressed
+        (or being compressed), otherwise read its file into the page cache.
+        """
+        if not self.enabled or key in self._promotions or key in self._read_aheads:
+            return
+        if self.cold is not None and (
+            key in self._moves or (key in self.cold.sessions and key not in self.hot.sessions)
+        ):
+            # The decompressed file is written through the page cache
+            task = asyncio.create_task(self._promote(key))
+            self._promotions[key] = task
+            task.add_done_callback(lambda _: self._promotions.pop(key, None))
+        elif self.read_ahead and key in self.hot.sessions:
+            task = asyncio.create_task(self._read_ahead(key))
+            self._read_aheads[key] = task
+            task.add_done_callback(lambda _: self._read_aheads.pop(key, None))
+
+    async def _read_ahead(self, key: str):
+        try:
+            with metrics.session_read_ahead_seconds.time():
+                await asyncio.to_thread(self._read_file_ahead, self.hot.path(key))
+            self.read_aheads += 1
+        except OSError as e:
+            logger.warning(f"Error reading ahead session for key {key}: {str(e)}")
+
+    @staticmethod
+    def _read_file_ahead(path: str):
+        with open(path, "rb") as f:
+            if hasattr(os, "posix_fadvise"):
+                # Asynchronous readahead by the kernel
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                return
+            while f.read(1 << 20):
+                pass
+
+    async def ensure_hot(self, key: str):
+        """Wait until the session for key is in the hot tier, if it exists."""
+        self.prefetch(key)
+        task = self._promotions.get(key)
+        if task is not None:
+            # The move finishes even if this request goes away
+            await asyncio.shield(task)
+
+    async def _promote(self, key: str):
+        try:
+            async with self._moving(key):
+                if key in self.hot.sessions or key not in self.cold.sessions:
+                    return
+                with metrics.session_promote_seconds.time():
+                    size = await self._run(self._decompress, key)
+                self.cold.forget(key)
+                self.hot.update(key, size, time.time())
+                self.promoted += 1
+                logger.info(f"Moved session for key: {key} back to the hot tier")
+        except Exception as e:
+            logger.error(f"Error decompressing session for key {key}: {str(e)}")
+
+    def _decompress(self, key: str) -> int:
+        hot_path = self.hot.path(key)
+        cold_path = self.cold.path(key)
+        suffix = self.cold.file_suffixes.get(key, self.cold.suffix)
+        codec = self._codec if suffix == self.cold.suffix else codec_for_suffix(suffix[len(".bin"):])
+        tmp_path = f"{hot_path}.tmp"
+        codec.decompress_file(cold_path, tmp_path)
+        os.replace(tmp_path, hot_path)
+        os.remove(cold_path)
+        return os.path.getsize(hot_path)
+
+    async def _demote(self, key: str) -> bool:
+        """Compress the session for key into the cold tier unless it is in use."""
+        async with self._moving(key):
+            if self._in_use(key) or key not in self.hot.sessions:
+                return False
+            last_access = self.hot.sessions[key][1]
+            try:
+                with metrics.session_demote_seconds.time():
+                    tmp_path = await self._run(self._compress, key)
+                # A request may have arrived while compressing
+                if self._in_use(key):
+                    await asyncio.to_thread(os.remove, tmp_path)
+                    return False
+                size = await asyncio.to_thread(self._commit_demote, key, tmp_path)
+            except Exception as e:
+                logger.error(f"Error compressing session for key {key}: {str(e)}")
+                return False
+            original = self.hot.forget(key)
+            self.cold.update(key, size, last_access)
+            self.demoted += 1
+            logger.info(f"Compressed session for key: {key} ({original} -> {size} bytes)")
+            return True
+
+    def _compress(self, key: str) -> str:
+        tmp_path = f"{self.cold.path(key, self.cold.suffix)}.tmp"
+        self._codec.compress_file(self.hot.path(key), tmp_path)
+        return tmp_path
+
+    def _commit_demote(self, key: str, tmp_path: str) -> int:
+        cold_path = self.cold.path(key, self.cold.suffix)
+        previous_path = self.cold.path(key)
+        os.replace(tmp_path, cold_path)
+        if previous_path != cold_path and os.path.exists(previous_path):
+            # Older copy written with another codec
+            os.remove(previous_path)
+        os.remove(self.hot.path(key))
+        return os.path.getsize(cold_path)
+
+    async def accessed(self, key: str):
+        """Record a restore of the session for key."""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            size = await asyncio.to_thread(self._touch, self.hot.path(key), now)
+        except OSError:
+            # No file yet, e.g. a new session
+            return
+        self.hot.update(key, size, now)
+
+    async def saved(self, key: str):
+        """
+        Record a save of the session for key.
+
+        Over the quota, eviction starts in the background: saves run while a
+        slot is leased, and compressing other sessions can take seconds.
+        """
+        if not self.enabled:
+            return
+        try:
+            stat = await asyncio.to_thread(os.stat, self.hot.path(key))
+        except OSError as e:
+            logger.warning(f"Saved session for key {key} not found in {self.directory}: {str(e)}")
+            return
+        self.hot.update(key, stat.st_size, stat.st_mtime)
+        if self.cold is not None and key in self.cold.sessions:
+            # Superseded by the new save
+            await self._remove(self.cold, key)
+        if self.max_bytes and self.hot.bytes > self.max_bytes:
+            self._schedule_evict()
+
+    def _schedule_evict(self):
+        """Start an eviction unless one is already running."""
+        if self._evict_task is not None and not self._evict_task.done():
+            return
+        self._evict_task = asyncio.create_task(self._evict_in_background())
+
+    async def _evict_in_background(self):
+        try:
+            await self.evict()
+        except Exception as e:
+            logger.error(f"Error enforcing the session quota: {str(e)}")
+
+    async def evict(self):
+        """
+        Delete expired sessions, compress idle ones, and compress (or delete,
+        without a cold tier) least recently used ones over the quota.
+        """
+        async with self._lock:
+            if self.ttl:
+                expired_before = time.time() - self.ttl
+                for tier in (self.hot, self.cold):
+                    if tier is None:
+                        continue
+                    expired = [
+                        key for key, (_, last_access) in tier.sessions.items()
+                        if last_access < expired_before
+                    ]
+                    for key in expired:
+                        if not self._in_use(key) and await self._remove(tier, key):
+                            self.evicted_ttl += 1
+                            metrics.session_evictions.inc(reason="ttl")
+                            logger.info(f"Deleted expired session for key: {key}")
+
+            if self.cold is not None and self.cold_after:
+                idle_before = time.time() - self.cold_after
+                idle = [
+                    key for key, (_, last_access) in self.hot.sessions.items()
+                    if last_access < idle_before
+                ]
+                for key in idle:
+                    await self._demote(key)
+
+            if self.max_bytes and self.hot.bytes > self.max_bytes:
+                # Leave some room so every save does not trigger an eviction
+                target = self.max_bytes * 0.9
+                for key in list(self.hot.sessions):
+                    if self.hot.bytes <= target:
+                        break
+                    if self.cold is not None:
+                        await self._demote(key)
+                    elif not self._in_use(key) and await self._remove(self.hot, key):
+                        self.evicted_quota += 1
+                        metrics.session_evictions.inc(reason="quota")
+                        logger.info(f"Deleted least recently used session for key: {key}")
+
+            if self.cold is not None and self.cold_max_bytes and self.cold.bytes > self.cold_max_bytes:
+                target = self.cold_max_bytes * 0.9
+                for key in list(self.cold.sessions):
+                    if self.cold.bytes <= target:
+                        break
+                    if not self._in_use(key) and await self._remove(self.cold, key):
+                        self.evicted_quota += 1
+                        metrics.session_evictions.inc(reason="cold_quota")
+                        logger.info(f"Deleted least recently used compressed session for key: {key}")
+
+    async def _remove(self, tier: Tier, key: str) -> bool:
+        try:
+            await asyncio.to_thread(os.remove, tier.path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error deleting {tier.name} session for key {key}: {str(e)}")
+            return False
+        tier.forget(key)
+        return True
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._rescan()
+                await self.evict()
+            except Exception as e:
+                logger.error(f"Error sweeping session store: {str(e)}")
+
+    def info(self, key: str) -> Optional[dict]:
+        """Tier, size and last access of the session file for key, None if unknown."""
+        for tier in (self.hot, self.cold):
+            if tier is not None and key in tier.sessions:
+                size, last_access = tier.sessions[key]
+                return {"key": key, "tier": tier.name, "size": size, "last_access": last_access}
+        return None
+
+    def list_sessions(self) -> List[dict]:
+        """All known sessions, most recently used first."""
+        keys = list(self.hot.sessions)
+        if self.cold is not None:
+            keys += [key for key in self.cold.sessions if key not in self.hot.sessions]
+        sessions = [self.info(key) for key in keys]
+        return sorted(sessions, key=lambda info: info["last_access"], reverse=True)
+
+    async def delete(self, key: str) -> Optional[int]:
+        """
+        Delete the session files for key from every tier.
+
+        Returns:
+            Size of the deleted files, or None if there was no file
+        """
+        async with self._lock, self._moving(key):
+            size = None
+            for tier in (self.hot, self.cold):
+                if tier is None or key not in tier.sessions:
+                    continue
+                tier_size = tier.sessions[key][0]
+                if not await self._remove(tier, key):
+                    raise OSError(f"Could not delete session for key: {key}")
+                size = (size or 0) + tier_size
+            if size is not None:
+                self.deleted += 1
+            return size
+
+    def stats(self) -> dict:
+        """Session counts and sizes per tier, eviction and compression counters."""
+        return {
+            "enabled": self.enabled,
+            **self.hot.stats(),
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "cold": {
+                **self.cold.stats(),
+                "max_bytes": self.cold_max_bytes,
+                "compression": self._codec.name,
+                "promoting": len(self._promotions),
+            } if self.cold is not None else None,
+            "evicted_quota": self.evicted_quota,
+            "evicted_ttl": self.evicted_ttl,
+            "deleted": self.deleted,
+            "promoted": self.promoted,
+            "demoted": self.demoted,
+            "read_aheads": self.read_aheads,
+        }
+
+
+# Shared store of the session files
+session_store = SessionStore(
+    settings.session_dir or None,
+    settings.session_max_bytes,
+    settings.session_ttl,
+    cold_dir=settings.session_cold_dir or None,
+    cold_max_bytes=settings.session_cold_max_bytes,
+    cold_after=settings.session_cold_after,
+    compression=settings.session_compression,
+    compression_workers=settings.session_compression_workers,
+    read_ahead=settings.session_read_ahead,
+)
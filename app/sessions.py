@@ -0,0 +1,487 @@
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+from typing import List, Optional
+
+import anyio
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app import metrics
+from app.backends import Backend, BackendPool, NoBackendError
+from app.clients import BackendClient, backend_client
+from app.config import settings
+from app.keys import KeyScheduler
+from app.saver import SessionSaver
+from app.session_store import session_store
+from app.slots import Slot
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class SessionSaveError(Exception):
+    """Raised when the original server did not save a session."""
+
+
+class SessionStreamingResponse(StreamingResponse):
+    """
+    Streaming response that runs a cleanup callback once the stream is over,
+    whether it was fully sent, failed or abandoned by the client.
+    """
+
+    def __init__(self, content, cleanup, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # The slot must be released even if the request task is cancelled
+            with anyio.CancelScope(shield=True):
+                await self.cleanup()
+
+
+class SessionService:
+    """
+    Session-managed chat completions against the original server.
+
+    Owns the backend pool (with the slots of every backend), the per-key
+    ordering and the background saver, and runs the restore/forward/save
+    pipeline. Used directly by every route that
+    needs a completion, so in-process callers do not go through HTTP.
+    """
+
+    def __init__(self, client: BackendClient, backend_urls: List[str]):
+        """
+        Args:
+            client: Shared client manager for requests to the original servers
+            backend_urls: URLs of the original servers
+        """
+        self.client = client
+
+        # Original servers and their slots, one slot is leased per request
+        self.backend_pool = BackendPool(
+            backend_urls,
+            settings.num_slots,
+            residency=settings.slot_residency,
+            unhealthy_after=settings.backend_unhealthy_after,
+        )
+
+        # Requests for one session key run in order
+        self.key_scheduler = KeyScheduler()
+
+        # Background saves for SESSION_SAVE_MODE=background
+        self.saver = SessionSaver(self.write_back, num_workers=settings.session_save_workers)
+
+        self._write_back_task: Optional[asyncio.Task] = None
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        return self.client.client
+
+    async def start(self):
+        """Detect the slots of the original servers and start background work."""
+        await self.backend_pool.start(self.http_client, settings.backend_health_check_interval)
+        await session_store.start(self.session_in_use, settings.session_sweep_interval)
+        self.saver.start()
+        if settings.slot_residency and settings.session_write_back_interval > 0:
+            self._write_back_task = asyncio.create_task(
+                self.write_back_loop(settings.session_write_back_interval)
+            )
+
+    async def stop(self):
+        """Stop background work and save every session that is not on disk yet."""
+        if self._write_back_task is not None:
+            self._write_back_task.cancel()
+            self._write_back_task = None
+        await self.backend_pool.stop()
+        await session_store.stop()
+        # Do not lose sessions that are queued for saving or only kept in the slots
+        await self.saver.drain(settings.original_server_timeout)
+        await self.write_back_all()
+
+    async def restore_session(self, backend: Backend, slot_id: int, key: str):
+        """
+        Restore the saved session for key into a slot of the original server.
+
+        Returns:
+            Restore details from the original server, or None if restore failed
+        """
+        filename = f"{key}.bin"
+        restore_url = f"{backend.url}/slots/{slot_id}?action=restore"
+        restore_payload = {"filename": filename}
+
+        logger.info(f"Restoring session for key: {key} into slot {slot_id} on {backend.url}")
+        with metrics.stage("restore", metrics.restore_seconds, backend=backend.url):
+            restore_response = await self.http_client.post(
+                restore_url,
+                json=restore_payload,
+                headers={"content-type": "application/json"}
+            )
+
+        restore_data = None
+        if restore_response.status_code == 200:
+            try:
+                restore_data = restore_response.json()
+                metrics.bytes_read.inc(restore_data.get("n_read") or 0, backend=backend.url)
+                await session_store.accessed(key)
+                logger.info(
+                    f"Session restore details: id_slot={restore_data.get('id_slot')}, "
+                    f"filename={restore_data.get('filename')}, "
+                    f"n_restored={restore_data.get('n_restored')}, "
+                    f"n_read={restore_data.get('n_read')}, "
+                    f"restore_ms={restore_data.get('timings', {}).get('restore_ms')}"
+                )
+            except Exception as e:
+                logger.error(f"Error parsing restore response: {str(e)}")
+        else:
+            metrics.restore_failures.inc(backend=backend.url)
+            logger.error(f"Session restore failed: {restore_response.text}")
+            # Continue anyway, might be a new session
+
+        return restore_data
+
+    async def save_session(self, backend: Backend, slot_id: int, key: str):
+        """
+        Save the session loaded into a slot of the original server for key.
+
+        Returns:
+            Save details from the original server, or None if save failed
+        """
+        filename = f"{key}.bin"
+        save_url = f"{backend.url}/slots/{slot_id}?action=save"
+        save_payload = {"filename": filename}
+
+        logger.info(f"Saving session for key: {key} from slot {slot_id} on {backend.url}")
+        with metrics.stage("save", metrics.save_seconds, backend=backend.url):
+            save_response = await self.http_client.post(
+                save_url,
+                json=save_payload,
+                headers={"content-type": "application/json"}
+            )
+
+        save_data = None
+        if save_response.status_code == 200:
+            try:
+                save_data = save_response.json()
+                metrics.bytes_written.inc(save_data.get("n_written") or 0, backend=backend.url)
+                await session_store.saved(key)
+                logger.info(
+                    f"Session save details: id_slot={save_data.get('id_slot')}, "
+                    f"filename={save_data.get('filename')}, "
+                    f"n_saved={save_data.get('n_saved')}, "
+                    f"n_written={save_data.get('n_written')}, "
+                    f"save_ms={save_data.get('timings', {}).get('save_ms')}"
+                )
+            except Exception as e:
+                logger.error(f"Error parsing save response: {str(e)}")
+        else:
+            metrics.save_failures.inc(backend=backend.url)
+            logger.error(f"Session save failed: {save_response.text}")
+
+        return save_data
+
+    def session_in_use(self, key: str) -> bool:
+        """Whether the session for key has requests or is loaded into a slot."""
+        return self.key_scheduler.depth(key) > 0 or bool(self.backend_pool.residency(key))
+
+    def drop_session(self, key: str) -> bool:
+        """
+        Drop the session for key from the slots, e.g. before deleting its file.
+
+        Returns:
+            False if the session is in use by a request or a save
+        """
+        if self.key_scheduler.depth(key) > 0:
+            return False
+        for backend, slot in self.backend_pool.residency(key):
+            if slot.busy or slot.save_pending:
+                return False
+        self.backend_pool.forget(key)
+        return True
+
+    async def write_back(self, backend: Backend, slot: Slot):
+        """
+        Save the session loaded into a leased slot if it has unsaved changes.
+
+        Raises:
+            SessionSaveError: The save failed, the slot stays dirty so it is retried
+        """
+        if slot.dirty and slot.key is not None:
+            if await self.save_session(backend, slot.id, slot.key) is None:
+                raise SessionSaveError(f"Saving session for key: {slot.key} on {backend.url} failed")
+            slot.dirty = False
+
+    async def take_over(self, key: str, backend: Backend):
+        """
+        Move the session for key to backend. Unsaved changes in copies left
+        on other backends are saved first, so the restore picks them up.
+        """
+        for other, old_slot in self.backend_pool.residency(key):
+            if other is backend or not old_slot.dirty:
+                continue
+            try:
+                async with other.slot_pool.lease_slot(old_slot):
+                    if old_slot.key == key:
+                        await self.write_back(other, old_slot)
+            except Exception as e:
+                logger.warning(
+                    f"Unsaved turns of session for key: {key} in slot {old_slot.id} "
+                    f"on {other.url} are lost: {str(e)}"
+                )
+        self.backend_pool.claim(key, backend)
+
+    async def load_session(self, backend: Backend, slot: Slot, key: str):
+        """Make the session for key the one loaded into a leased slot."""
+        if slot.resident:
+            logger.info(f"Session for key: {key} is resident in slot {slot.id}, skipping restore")
+            return
+        metrics.restore_misses.inc(backend=backend.url)
+        # The slot is about to be handed to another key
+        if slot.key != key:
+            await self.write_back(backend, slot)
+        backend.slot_pool.assign(slot, key)
+        await self.take_over(key, backend)
+        # Decompression started when the request arrived
+        await session_store.ensure_hot(key)
+        await self.restore_session(backend, slot.id, key)
+
+    async def finish_session(self, backend: Backend, slot: Slot):
+        """Mark the session in a leased slot as changed and save it unless it stays resident."""
+        slot.dirty = True
+        if not settings.slot_residency:
+            if settings.session_save_mode == "background":
+                # The slot stays reserved for this key until the save is done
+                self.saver.submit(backend, slot)
+            else:
+                try:
+                    await self.write_back(backend, slot)
+                except SessionSaveError as e:
+                    # The reply is still good, the save is retried on the next write-back or eviction
+                    logger.error(str(e))
+
+    async def write_back_all(self):
+        """Save every idle slot with unsaved changes."""
+        for backend, slot in self.backend_pool.dirty_slots():
+            try:
+                async with backend.slot_pool.lease_slot(slot):
+                    await self.write_back(backend, slot)
+            except Exception as e:
+                logger.error(f"Error writing back slot {slot.id} on {backend.url}: {str(e)}")
+
+    async def write_back_loop(self, interval: float):
+        """Periodically save sessions that stay resident in their slots."""
+        while True:
+            await asyncio.sleep(interval)
+            if settings.session_save_mode == "background":
+                for backend, slot in self.backend_pool.dirty_slots():
+                    self.saver.submit(backend, slot)
+            else:
+                await self.write_back_all()
+
+    async def complete(self, key: str, request: dict) -> dict:
+        """
+        Run a non-streaming chat completion in the session for key.
+
+        With COALESCE_REQUESTS, identical requests for the same key that are
+        in flight together share one backend call.
+
+        Returns:
+            Response data from the original server
+
+        Raises:
+            HTTPException: The original server or the pipeline failed
+        """
+        with metrics.request_seconds.time(stream="false"):
+            if settings.coalesce_requests:
+                fingerprint = self.key_scheduler.fingerprint(key, request)
+                return await self.key_scheduler.coalesce(
+                    fingerprint, lambda: self._complete(key, request)
+                )
+            return await self._complete(key, request)
+
+    @staticmethod
+    def _record_timings(backend: Backend, response_data: dict):
+        """Record generation speed from the timings of a completion."""
+        timings = response_data.get("timings") or {}
+        if timings.get("predicted_per_second"):
+            metrics.tokens_per_second.observe(timings["predicted_per_second"], backend=backend.url)
+        if timings.get("prompt_per_second"):
+            metrics.prompt_tokens_per_second.observe(timings["prompt_per_second"], backend=backend.url)
+
+    def _backend_error(self, backend: Backend, e: Exception) -> HTTPException:
+        """Take note of a backend that could not be reached."""
+        self.backend_pool.mark_failure(backend, str(e))
+        logger.error(f"Original server {backend.url} failed: {str(e)}")
+        return HTTPException(status_code=502, detail=f"Original server unavailable: {str(e)}")
+
+    def prefetch(self, key: str):
+        """
+        Get the session file for key ready while the request waits for its
+        turn and a slot, unless the session is still loaded into a slot.
+        """
+        if not self.backend_pool.residency(key):
+            session_store.prefetch(key)
+
+    async def _complete(self, key: str, request: dict) -> dict:
+        arrival = time.perf_counter()
+        self.prefetch(key)
+        try:
+            async with self.key_scheduler.hold(key):
+                backend = self.backend_pool.route(key)
+                async with backend.slot_pool.lease(key) as slot:
+                    queue_wait = time.perf_counter() - arrival
+                    metrics.queue_wait_seconds.observe(queue_wait, backend=backend.url)
+                    metrics.record_stage("queue", queue_wait)
+                    try:
+                        # Step 1: Restore session
+                        await self.load_session(backend, slot, key)
+
+                        # Step 2: Forward the request to the original server
+                        forward_url = f"{backend.url}/v1/chat/completions"
+                        logger.info(f"Forwarding request to original server {backend.url}")
+
+                        with metrics.stage("forward", metrics.forward_seconds, backend=backend.url):
+                            forward_response = await self.http_client.post(
+                                forward_url,
+                                json={**request, "id_slot": slot.id},
+                                headers={"content-type": "application/json"}
+                            )
+                    except httpx.TransportError as e:
+                        raise self._backend_error(backend, e)
+                    self.backend_pool.mark_success(backend)
+
+                    if forward_response.status_code != 200:
+                        logger.error(f"Original server request failed: {forward_response.text}")
+                        raise HTTPException(
+                            status_code=forward_response.status_code,
+                            detail="Request to original server failed"
+                        )
+
+                    # Get the response data
+                    response_data = forward_response.json()
+                    self._record_timings(backend, response_data)
+
+                    # Step 3: Save the session
+                    await self.finish_session(backend, slot)
+
+                    # Step 4: Return the response to the client
+                    return response_data
+
+        except NoBackendError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception(f"Error processing request: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    async def stream(self, key: str, request: dict) -> SessionStreamingResponse:
+        """
+        Streaming variant of complete.
+
+        The slot is leased and the session restored before the response
+        starts, so errors from the original server keep their status code.
+        Server-sent events are then piped to the client chunk by chunk, and
+        the session is saved (and the slot released) after the stream ends.
+        If the client disconnects mid-stream the upstream request is closed,
+        which stops generation on the original server.
+        """
+        arrival = time.perf_counter()
+        self.prefetch(key)
+        exit_stack = AsyncExitStack()
+        streaming = False
+        try:
+            await exit_stack.enter_async_context(self.key_scheduler.hold(key))
+            backend = self.backend_pool.route(key)
+            slot = await exit_stack.enter_async_context(backend.slot_pool.lease(key))
+            queue_wait = time.perf_counter() - arrival
+            metrics.queue_wait_seconds.observe(queue_wait, backend=backend.url)
+            metrics.record_stage("queue", queue_wait)
+
+            try:
+                # Step 1: Restore session
+                await self.load_session(backend, slot, key)
+
+                # Step 2: Forward the request to the original server
+                forward_url = f"{backend.url}/v1/chat/completions"
+                logger.info(f"Forwarding streaming request to original server {backend.url}")
+                forward_start = time.perf_counter()
+
+                forward_response = await exit_stack.enter_async_context(self.http_client.stream(
+                    "POST",
+                    forward_url,
+                    json={**request, "id_slot": slot.id},
+                    headers={"content-type": "application/json"}
+                ))
+            except httpx.TransportError as e:
+                raise self._backend_error(backend, e)
+            self.backend_pool.mark_success(backend)
+
+            if forward_response.status_code != 200:
+                await forward_response.aread()
+                logger.error(f"Original server request failed: {forward_response.text}")
+                raise HTTPException(
+                    status_code=forward_response.status_code,
+                    detail="Request to original server failed"
+                )
+            streaming = True
+
+        except NoBackendError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception(f"Error processing request: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        finally:
+            # Until the response takes over, the slot is released here
+            if not streaming:
+                await exit_stack.aclose()
+
+        completed = False
+
+        async def relay():
+            nonlocal completed
+            async for chunk in forward_response.aiter_raw():
+                yield chunk
+            completed = True
+
+        async def cleanup():
+            try:
+                if not completed:
+                    logger.info(f"Stream for key: {key} ended early, closing upstream request")
+                await forward_response.aclose()
+                metrics.forward_seconds.observe(time.perf_counter() - forward_start, backend=backend.url)
+
+                # Step 3: Save the session
+                await self.finish_session(backend, slot)
+            except Exception as e:
+                logger.error(f"Error finishing stream for key {key}: {str(e)}")
+            finally:
+                await exit_stack.aclose()
+                metrics.request_seconds.observe(time.perf_counter() - arrival, stream="true")
+
+        # Step 4: Stream the response to the client
+        return SessionStreamingResponse(
+            relay(),
+            cleanup,
+            media_type=forward_response.headers.get("content-type", "text/event-stream"),
+            headers={"cache-control": "no-cache"},
+        )
+
+    def stats(self) -> dict:
+        """Backend, slot, save and per-key statistics."""
+        return {
+            "backends": self.backend_pool.stats(),
+            "saves": self.saver.stats(),
+            "keys": self.key_scheduler.stats(),
+        }
+
+
+# Shared session service used by all routes
+session_service = SessionService(backend_client, settings.backend_url_list)
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import httpx
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class Slot:
+    """State of one original server slot as seen by the proxy."""
+
+    def __init__(self, slot_id: int):
+        self.id = slot_id
+        self.key: Optional[str] = None  # Session currently loaded into the slot
+        self.dirty = False  # Loaded session has changes that are not saved yet
+        self.save_pending = False  # Queued for a background save, not available to other keys
+        self.busy = False
+        self.resident = False  # Set on lease: the leased key is already loaded
+        self.last_used = 0.0
+
+
+class SlotPool:
+    """
+    Pool of llama.cpp server slots.
+
+    Every request leases one slot for the whole restore/forward/save cycle so
+    concurrent sessions never share a KV cache. When all slots are busy,
+    requests wait until one is released.
+
+    The pool remembers which session key is loaded into each slot. A request
+    for a key that is still resident gets its old slot back and can skip the
+    restore; other keys get an empty slot or the least recently used one.
+    Slots waiting for a background save are only handed out to their own key.
+    """
+
+    def __init__(self, num_slots: int = 0, residency: bool = True):
+        """
+        Args:
+            num_slots: Number of slots to use, 0 to detect from the original server
+            residency: Reuse sessions that are still loaded into a slot
+        """
+        self.num_slots = num_slots
+        self.residency = residency
+        self.slots: List[Slot] = []
+        self._resident: Dict[str, Slot] = {}
+        self._cond: Optional[asyncio.Condition] = None
+        self.waiting = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def discover(self, client: httpx.AsyncClient, base_url: str) -> int:
+        """
+        Ask the original server how many slots it was started with (-np).
+
+        Tries /props (total_slots) first, then the length of /slots. Falls back
+        to a single slot if neither endpoint is available.
+        """
+        try:
+            response = await client.get(f"{base_url}/props")
+            if response.status_code == 200:
+                total_slots = response.json().get("total_slots")
+                if total_slots:
+                    return int(total_slots)
+        except Exception as e:
+            logger.warning(f"Could not read /props from original server: {str(e)}")
+
+        try:
+            response = await client.get(f"{base_url}/slots")
+            if response.status_code == 200:
+                slots = response.json()
+                if isinstance(slots, list) and slots:
+                    return len(slots)
+        except Exception as e:
+            logger.warning(f"Could not read /slots from original server: {str(e)}")
+
+        logger.warning("Slot count detection failed, using a single slot")
+        return 1
+
+    async def start(self, client: httpx.AsyncClient, base_url: str):
+        """Detect the slot count if needed and mark every slot as free."""
+        if self.num_slots <= 0:
+            self.num_slots = await self.discover(client, base_url)
+
+        self.slots = [Slot(slot_id) for slot_id in range(self.num_slots)]
+        self._resident = {}
+        self._cond = asyncio.Condition()
+
+        logger.info(f"Slot pool started with {self.num_slots} slots")
+
+    def _pick(self, key: str) -> Optional[Slot]:
+        """Choose a slot for key, or None if the request has to wait."""
+        slot = self._resident.get(key)
+        if slot is not None:
+            # Keep the session where it is loaded, even if it means waiting
+            return None if slot.busy else slot
+
+        free = [slot for slot in self.slots if not slot.busy and not slot.save_pending]
+        if not free:
+            return None
+        # Prefer empty slots, then the least recently used one
+        return min(free, key=lambda slot: (slot.key is not None, slot.last_used))
+
+    def assign(self, slot: Slot, key: str):
+        """Record that the session for key is now loaded into slot."""
+        if slot.key is not None and slot.key != key:
+            self._resident.pop(slot.key, None)
+            self.evictions += 1
+        slot.key = key
+        slot.dirty = False
+        self._resident[key] = slot
+
+    def holds(self, key: str) -> bool:
+        """Whether the session for key is loaded into one of the slots."""
+        return key in self._resident
+
+    def resident_slot(self, key: str) -> Optional[Slot]:
+        """Slot the session for key is loaded into, if any."""
+        return self._resident.get(key)
+
+    def forget(self, key: str):
+        """Drop the copy of the session for key, e.g. after it moved to another server."""
+        slot = self._resident.pop(key, None)
+        if slot is not None:
+            slot.key = None
+            slot.dirty = False
+
+    async def _acquire(self, pick) -> Slot:
+        if self._cond is None:
+            raise RuntimeError("Slot pool is not started")
+
+        async with self._cond:
+            self.waiting += 1
+            try:
+                await self._cond.wait_for(lambda: pick() is not None)
+            finally:
+                self.waiting -= 1
+            slot = pick()
+            slot.busy = True
+        return slot
+
+    async def _release(self, slot: Slot):
+        slot.last_used = time.monotonic()
+        async with self._cond:
+            slot.busy = False
+            self._cond.notify_all()
+
+    @asynccontextmanager
+    async def lease(self, key: str):
+        """
+        Lease a slot for the session key, waiting if none is available.
+
+        Yields:
+            The leased Slot. slot.resident tells whether the session for key
+            is already loaded; otherwise slot.key is the session that will be
+            evicted (and has to be saved first if slot.dirty).
+        """
+        slot = await self._acquire(lambda: self._pick(key))
+
+        # Unsaved state is newer than the file, so it is never restored over
+        slot.resident = slot.key == key and (self.residency or slot.dirty)
+        if slot.resident:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        try:
+            yield slot
+        finally:
+            await self._release(slot)
+
+    @asynccontextmanager
+    async def lease_slot(self, slot: Slot):
+        """Lease a specific slot, e.g. to write its session back."""
+        await self._acquire(lambda: None if slot.busy else slot)
+        try:
+            yield slot
+        finally:
+            await self._release(slot)
+
+    def dirty_slots(self) -> List[Slot]:
+        """Idle slots holding sessions that are not saved yet."""
+        return [slot for slot in self.slots if slot.dirty and not slot.busy]
+
+    def stats(self) -> dict:
+        """Current pool occupancy and residency counters."""
+        lookups = self.hits + self.misses
+        return {
+            "num_slots": self.num_slots,
+            "busy": sum(1 for slot in self.slots if slot.busy),
+            "waiting": self.waiting,
+            "resident": {slot.key: slot.id for slot in self.slots if slot.key is not None},
+            "dirty": sum(1 for slot in self.slots if slot.dirty),
+            "save_pending": sum(1 for slot in self.slots if slot.save_pending),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.clients import backend_client
+from app.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens of commit texts.
+
+    Counts come from the original server's /tokenize endpoint ("backend"
+    mode) or from a characters-per-token estimate ("estimate" mode), and are
+    cached by a caller supplied key such as the commit hash, since rendered
+    commits never change.
+    """
+
+    def __init__(self, mode: str = "estimate", chars_per_token: float = 3.5, max_entries: int = 100000):
+        """
+        Args:
+            mode: "estimate" or "backend"
+            chars_per_token: Average characters per token for estimates
+            max_entries: Number of cached counts
+        """
+        self.mode = mode
+        self.chars_per_token = chars_per_token
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.backend_errors = 0
+
+    def estimate(self, text: str) -> int:
+        """Fast local estimate of the number of tokens in text."""
+        return int(len(text) / self.chars_per_token) + 1
+
+    async def _tokenize(self, text: str) -> int:
+        try:
+            response = await backend_client.client.post(
+                f"{settings.backend_url_list[0]}/tokenize",
+                json={"content": text},
+                headers={"content-type": "application/json"}
+            )
+            if response.status_code == 200:
+                return len(response.json().get("tokens", []))
+            logger.warning(f"Tokenize request failed: {response.text}")
+        except Exception as e:
+            logger.warning(f"Error tokenizing on original server: {str(e)}")
+        self.backend_errors += 1
+        return self.estimate(text)
+
+    async def count(self, text: str, key: Optional[str] = None) -> int:
+        """
+        Count tokens in text, using the cached count for key if there is one.
+        """
+        if key is not None:
+            count = self._cache.get(key)
+            if count is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return count
+            self.misses += 1
+
+        if self.mode == "backend":
+            count = await self._tokenize(text)
+        else:
+            count = self.estimate(text)
+
+        if key is not None:
+            self._cache[key] = count
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return count
+
+    async def count_many(self, texts: List[str], keys: List[Optional[str]]) -> List[int]:
+        """Count tokens of several texts concurrently."""
+        return await asyncio.gather(
+            *[self.count(text, key) for text, key in zip(texts, keys)]
+        )
+
+    def stats(self) -> dict:
+        """Cached counts and hit counters."""
+        return {
+            "mode": self.mode,
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "backend_errors": self.backend_errors,
+        }
+
+
+# Shared token counter for /git/history budgets
+token_counter = TokenCounter(settings.token_count_mode, settings.token_estimate_chars_per_token)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark for git history extraction used by /git/history.
+
+Builds a synthetic repository with thousands of commits (via git fast-import)
+and compares the previous extraction (one `git log` plus one `git show` per
+commit) with the single streamed `git log -p` pass, cold and with the
+commit cache warm. Also checks that both
+produce byte-for-byte the same prompt.
+
+Usage:
+    python benchmarks/bench_git_history.py [--commits N] [--num-commits N] [--repo PATH]
+
+Arguments:
+    --commits           - Number of commits in the synthetic repository (default: 3000)
+    -n, --num-commits   - Number of recent commits to extract (default: 500)
+    --repo              - Use an existing repository instead of a synthetic one
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.routers.git_history import get_git_history, format_git_history_request
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark git history extraction"
+    )
+    parser.add_argument(
+        "--commits",
+        type=int,
+        default=3000,
+        help="Number of commits in the synthetic repository (default: 3000)"
+    )
+    parser.add_argument(
+        "-n", "--num-commits",
+        dest="num_commits",
+        type=int,
+        default=500,
+        help="Number of recent commits to extract (default: 500)"
+    )
+    parser.add_argument(
+        "--repo",
+        default=None,
+        help="Use an existing repository instead of a synthetic one"
+    )
+    return parser.parse_args()
+
+
+def create_synthetic_repo(path, num_commits, num_files=50):
+    """Create a repository with num_commits commits touching a few files each."""
+    subprocess.run(["git", "init", "-q", path], check=True)
+
+    lines = []
+    for i in range(num_commits):
+        message = f"Change {i}\n\nTouch files for commit {i}.\n"
+        lines.append("commit refs/heads/master")
+        lines.append(f"committer Bench <bench@example.com> {1700000000 + i * 60} +0000")
+        lines.append(f"data {len(message.encode())}")
+        lines.append(message)
+        for j in range(3):
+            file_id = (i * 7 + j * 13) % num_files
+            content = "".join(
+                f"line {k} of file {file_id}, revision {i}\n" for k in range(20)
+            )
+            lines.append(f"M 100644 inline src/module_{file_id}.py")
+            lines.append(f"data {len(content.encode())}")
+            lines.append(content)
+    stream = "\n".join(lines) + "\n"
+
+    subprocess.run(
+        ["git", "-C", path, "fast-import", "--quiet"],
+        input=stream, text=True, check=True
+    )
+    subprocess.run(["git", "-C", path, "reset", "-q", "--hard", "master"], check=True)
+
+
+def get_git_history_per_commit(repo_path, num_commits):
+    """Previous implementation: git log for hashes, then git show per commit."""
+    cmd = ["git", "-C", repo_path, "log", f"-{num_commits}", "--format=%H"]
+    process = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    commits = []
+    for commit_hash in process.stdout.strip().split("\n"):
+        if not commit_hash:
+            continue
+        cmd = ["git", "-C", repo_path, "show", commit_hash]
+        process = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        commits.append({
+            "hash": commit_hash,
+            "short_hash": commit_hash[:8],
+            "content": process.stdout
+        })
+    return commits
+
+
+async def run_benchmark(repo_path, num_commits):
+    start = time.perf_counter()
+    baseline = get_git_history_per_commit(repo_path, num_commits)
+    baseline_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    streamed = await get_git_history(repo_path, num_commits)
+    streamed_time = time.perf_counter() - start
+
+    # Same query again, commits come from the commit cache
+    start = time.perf_counter()
+    await get_git_history(repo_path, num_commits)
+    cached_time = time.perf_counter() - start
+
+    query = "Explain the main functionality"
+    same = (
+        await format_git_history_request(baseline, query)
+        == await format_git_history_request(streamed, query)
+    )
+
+    print(f"Commits extracted: {len(streamed)}")
+    print(f"git show per commit: {baseline_time * 1000:.1f} ms")
+    print(f"single git log -p:   {streamed_time * 1000:.1f} ms")
+    print(f"repeat (cached):     {cached_time * 1000:.1f} ms")
+    print(f"Speedup: {baseline_time / streamed_time:.1f}x, cached {baseline_time / cached_time:.1f}x")
+    print(f"Identical prompt: {same}")
+    return same
+
+
+def main():
+    args = parse_arguments()
+
+    if args.repo:
+        same = asyncio.run(run_benchmark(args.repo, args.num_commits))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            repo_path = os.path.join(tmp, "repo")
+            print(f"Creating synthetic repository with {args.commits} commits...")
+            create_synthetic_repo(repo_path, args.commits)
+            same = asyncio.run(run_benchmark(repo_path, args.num_commits))
+
+    sys.exit(0 if same else 1)
+
+
+if __name__ == "__main__":
+    main()
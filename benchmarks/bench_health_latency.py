@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Load test: /health latency while /git/history requests are running.
+
+Measures /health latency on an idle service, then again while several
+/git/history requests extract a large synthetic repository. With git running
+as asyncio subprocesses the two distributions should stay close; a blocking
+git call shows up as /health latency in the hundreds of milliseconds.
+
+The service must be running (python run.py). /git/history requests may fail
+after extraction if no original server is available; only the extraction
+load matters here.
+
+Usage:
+    python benchmarks/bench_health_latency.py [--commits N] [--concurrency N]
+
+Arguments:
+    --commits         - Number of commits in the synthetic repository (default: 3000)
+    -n, --num-commits - Number of commits each /git/history request extracts (default: 1000)
+    -c, --concurrency - Number of concurrent /git/history requests (default: 4)
+    --duration        - Seconds to sample /health in each phase (default: 5)
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import httpx
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_git_history import create_synthetic_repo
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = os.getenv("PORT", "8000")
+BASE_URL = f"http://{HOST}:{PORT}"
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Measure /health latency while /git/history runs"
+    )
+    parser.add_argument("--commits", type=int, default=3000,
+                        help="Number of commits in the synthetic repository (default: 3000)")
+    parser.add_argument("-n", "--num-commits", dest="num_commits", type=int, default=1000,
+                        help="Number of commits each /git/history request extracts (default: 1000)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4,
+                        help="Number of concurrent /git/history requests (default: 4)")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="Seconds to sample /health in each phase (default: 5)")
+    return parser.parse_args()
+
+
+async def sample_health(client, duration):
+    """Call /health back to back for duration seconds, return latencies in ms."""
+    latencies = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        await client.get(f"{BASE_URL}/health")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+async def history_load(client, repo_path, num_commits, stop):
+    """Send /git/history requests until stop is set."""
+    while not stop.is_set():
+        try:
+            await client.post(
+                f"{BASE_URL}/git/history",
+                json={"repo_path": repo_path, "query": "load test", "num_commits": num_commits},
+            )
+        except httpx.HTTPError:
+            pass
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:>8}: n={len(latencies)} p50={statistics.median(latencies):.1f} ms "
+        f"p95={p95:.1f} ms max={latencies[-1]:.1f} ms"
+    )
+
+
+async def run(args, repo_path):
+    async with httpx.AsyncClient(timeout=600) as client:
+        idle = await sample_health(client, args.duration)
+
+        stop = asyncio.Event()
+        load = [
+            asyncio.create_task(history_load(client, repo_path, args.num_commits, stop))
+            for _ in range(args.concurrency)
+        ]
+        loaded = await sample_health(client, args.duration)
+        stop.set()
+        await asyncio.gather(*load)
+
+    report("idle", idle)
+    report("loaded", loaded)
+
+
+def main():
+    args = parse_arguments()
+    with tempfile.TemporaryDirectory() as tmp:
+        repo_path = os.path.join(tmp, "repo")
+        print(f"Creating synthetic repository with {args.commits} commits...")
+        create_synthetic_repo(repo_path, args.commits)
+        asyncio.run(run(args, repo_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Benchmark for restore latency from the hot and cold session tiers.
+
+Writes a synthetic KV-cache snapshot (random f16-like values) or uses a real
+llama.cpp slot save file, then measures for every available codec how long
+compressing it into the cold tier takes, the compression ratio, and the
+time to restore from each tier: reading the hot file, and decompressing the
+cold file back into the hot tier and reading it. Given the prompt length and
+prompt processing speed of the backend, it also prints the time a full
+recompute of the session would take.
+
+Usage:
+    python benchmarks/bench_session_tiers.py [--size MB] [--file PATH] [--repeat N]
+                                             [--prompt-tokens N --prompt-tps X]
+
+Arguments:
+    --size          - Size of the synthetic snapshot in MB (default: 256)
+    --file          - Use an existing session file instead of a synthetic one
+    --repeat        - Runs per measurement, the best is reported (default: 3)
+    --prompt-tokens - Tokens in the saved session, for the recompute estimate
+    --prompt-tps    - Prompt processing speed of the backend in tokens/s
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.codecs import CODECS
+
+CHUNK_SIZE = 1 << 20
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark session restore latency per storage tier"
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=256,
+        help="Size of the synthetic snapshot in MB (default: 256)"
+    )
+    parser.add_argument(
+        "--file",
+        default=None,
+        help="Use an existing session file instead of a synthetic one"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs per measurement, the best is reported (default: 3)"
+    )
+    parser.add_argument(
+        "--prompt-tokens",
+        dest="prompt_tokens",
+        type=int,
+        default=None,
+        help="Tokens in the saved session, for the recompute estimate"
+    )
+    parser.add_argument(
+        "--prompt-tps",
+        dest="prompt_tps",
+        type=float,
+        default=None,
+        help="Prompt processing speed of the backend in tokens/s"
+    )
+    return parser.parse_args()
+
+
+def create_synthetic_snapshot(path, size_mb):
+    """
+    Write size_mb of little-endian f16-like values: random mantissas with
+    the exponents of values around zero, as in a KV cache.
+    """
+    rng = random.Random(0)
+    # High bytes of f16 values between about 1e-3 and 4, either sign
+    exponents = [sign | exponent for sign in (0x00, 0x80) for exponent in range(0x14, 0x44)]
+    weights = [1.0 / (1 + abs((exponent & 0x7F) - 0x3A)) for exponent in exponents]
+    table = bytes(rng.choices(exponents, weights, k=256))
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            low = os.urandom(CHUNK_SIZE // 2)
+            high = os.urandom(CHUNK_SIZE // 2).translate(table)
+            block = bytearray(CHUNK_SIZE)
+            block[0::2] = low
+            block[1::2] = high
+            f.write(block)
+
+
+def read_file(path):
+    """Read a file the way the backend loads a snapshot."""
+    with open(path, "rb") as f:
+        while f.read(CHUNK_SIZE):
+            pass
+
+
+def best_of(repeat, func):
+    """Best wall time of repeat runs of func in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def available_codecs():
+    codecs = []
+    for name, codec_class in CODECS.items():
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            print(f"{name}: not installed, skipped")
+    return codecs
+
+
+def main():
+    args = parse_arguments()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.file:
+            snapshot = args.file
+        else:
+            snapshot = os.path.join(tmp_dir, "session.bin")
+            print(f"Writing a {args.size} MB synthetic snapshot...")
+            create_synthetic_snapshot(snapshot, args.size)
+        size = os.path.getsize(snapshot)
+        print(f"Snapshot: {size / 1e6:.1f} MB\n")
+
+        hot_time = best_of(args.repeat, lambda: read_file(snapshot))
+        print(f"{'tier':<12} {'ratio':>7} {'compress':>10} {'restore':>10}")
+        print(f"{'hot':<12} {1.0:>7.2f} {'-':>10} {hot_time * 1000:>8.0f}ms")
+
+        for codec in available_codecs():
+            cold_path = os.path.join(tmp_dir, f"session.bin{codec.suffix}")
+            promoted_path = os.path.join(tmp_dir, "promoted.bin")
+            compress_time = best_of(args.repeat, lambda: codec.compress_file(snapshot, cold_path))
+            ratio = size / os.path.getsize(cold_path)
+
+            def restore():
+                codec.decompress_file(cold_path, promoted_path)
+                read_file(promoted_path)
+
+            cold_time = best_of(args.repeat, restore)
+            print(
+                f"{'cold ' + codec.name:<12} {ratio:>7.2f} {compress_time * 1000:>8.0f}ms "
+                f"{cold_time * 1000:>8.0f}ms"
+            )
+            os.remove(cold_path)
+            os.remove(promoted_path)
+
+        if args.prompt_tokens and args.prompt_tps:
+            recompute = args.prompt_tokens / args.prompt_tps
+            print(f"{'recompute':<12} {'-':>7} {'-':>10} {recompute * 1000:>8.0f}ms")
+
+    print("\nHot reads come from the page cache after the first run, so they are a lower bound.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Load generator for the session service.
+
+Sends chat completions for many session keys with a fixed number of
+requests in flight and reports latency percentiles (p50/p95/p99) and
+throughput, end to end and per stage of the service pipeline (queue wait,
+restore, forward, save) from the Server-Timing header. Each key is a
+conversation that grows by one user turn per request, so the sessions
+behave like real multi-turn chats.
+
+Run it against the service started on the mock backend to measure
+performance changes offline:
+
+    python benchmarks/mock_backend.py --port 8080 --slots 4 &
+    ORIGINAL_SERVER_URL=http://localhost:8080 uvicorn app.main:app --port 8000 &
+    python benchmarks/load_test.py --requests 1000 --concurrency 16 --keys 50 --distribution zipf
+
+Usage:
+    python benchmarks/load_test.py [--url URL] [--requests N] [--concurrency N] [--keys N]
+                                   [--distribution uniform|zipf] [--zipf-s S]
+                                   [--stream-ratio R] [--turn-chars N] [--seed N] [--json]
+
+Arguments:
+    --url           - Base URL of the session service (default: http://localhost:8000)
+    --requests      - Total number of requests (default: 500)
+    --concurrency   - Requests in flight at the same time (default: 8)
+    --keys          - Number of distinct session keys (default: 20)
+    --distribution  - Key popularity: uniform or zipf (default: uniform)
+    --zipf-s        - Exponent of the Zipf distribution (default: 1.1)
+    --stream-ratio  - Fraction of streaming requests (default: 0)
+    --turn-chars    - Characters of user text added per turn (default: 400)
+    --seed          - Random seed (default: 0)
+    --json          - Print the report as JSON
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+
+import httpx
+
+# Stages reported by the service in Server-Timing, in pipeline order
+STAGES = ("queue", "restore", "forward", "save", "total")
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Load generator for the session service")
+    parser.add_argument("--url", default="http://localhost:8000",
+                        help="Base URL of the session service (default: http://localhost:8000)")
+    parser.add_argument("--requests", type=int, default=500,
+                        help="Total number of requests (default: 500)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Requests in flight at the same time (default: 8)")
+    parser.add_argument("--keys", type=int, default=20,
+                        help="Number of distinct session keys (default: 20)")
+    parser.add_argument("--distribution", choices=("uniform", "zipf"), default="uniform",
+                        help="Key popularity: uniform or zipf (default: uniform)")
+    parser.add_argument("--zipf-s", dest="zipf_s", type=float, default=1.1,
+                        help="Exponent of the Zipf distribution (default: 1.1)")
+    parser.add_argument("--stream-ratio", dest="stream_ratio", type=float, default=0.0,
+                        help="Fraction of streaming requests (default: 0)")
+    parser.add_argument("--turn-chars", dest="turn_chars", type=int, default=400,
+                        help="Characters of user text added per turn (default: 400)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed (default: 0)")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the report as JSON")
+    return parser.parse_args()
+
+
+def key_sequence(args):
+    """Keys of all requests, drawn from the chosen popularity distribution."""
+    rng = random.Random(args.seed)
+    keys = [f"load-{i}" for i in range(args.keys)]
+    if args.distribution == "zipf":
+        weights = [1.0 / (rank ** args.zipf_s) for rank in range(1, args.keys + 1)]
+    else:
+        weights = [1.0] * args.keys
+    return rng.choices(keys, weights, k=args.requests)
+
+
+def parse_server_timing(header: str) -> dict:
+    """Stage durations in milliseconds from a Server-Timing header."""
+    stages = {}
+    for entry in header.split(","):
+        parts = [part.strip() for part in entry.split(";")]
+        for part in parts[1:]:
+            if part.startswith("dur="):
+                try:
+                    stages[parts[0]] = float(part[4:])
+                except ValueError:
+                    pass
+    return stages
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed + 1)
+        self.turns = defaultdict(int)
+        self.samples = defaultdict(list)  # Stage -> durations in ms
+        self.errors = defaultdict(int)  # Status -> count
+        self.completed = 0
+
+    def build_request(self, key: str) -> dict:
+        """Next turn of the conversation for key, with all previous turns."""
+        self.turns[key] += 1
+        messages = []
+        for turn in range(self.turns[key]):
+            text = f"Turn {turn} of {key}. " + "lorem ipsum " * (self.args.turn_chars // 12)
+            messages.append({"role": "user", "content": text})
+            if turn < self.turns[key] - 1:
+                messages.append({"role": "assistant", "content": f"Answer {turn}"})
+        request = {"messages": messages}
+        if self.rng.random() < self.args.stream_ratio:
+            request["stream"] = True
+        return {"key": key, "request": request}
+
+    async def send(self, client: httpx.AsyncClient, key: str):
+        payload = self.build_request(key)
+        url = f"{self.args.url}/v1/chat/completions"
+        start = time.perf_counter()
+        try:
+            if payload["request"].get("stream"):
+                async with client.stream("POST", url, json=payload) as response:
+                    first_byte = None
+                    async for _ in response.aiter_raw():
+                        if first_byte is None:
+                            first_byte = time.perf_counter()
+                    status = response.status_code
+                    headers = response.headers
+                if first_byte is not None:
+                    self.samples["first_byte"].append((first_byte - start) * 1000)
+            else:
+                response = await client.post(url, json=payload)
+                status = response.status_code
+                headers = response.headers
+        except httpx.HTTPError as e:
+            self.errors[type(e).__name__] += 1
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if status != 200:
+            self.errors[str(status)] += 1
+            return
+        self.completed += 1
+        self.samples["client"].append(elapsed)
+        stages = parse_server_timing(headers.get("server-timing", ""))
+        for stage in STAGES:
+            if stage in stages and not (payload["request"].get("stream") and stage == "total"):
+                self.samples[stage].append(stages[stage])
+
+    async def run(self):
+        keys = key_sequence(self.args)
+        queue: asyncio.Queue = asyncio.Queue()
+        for key in keys:
+            queue.put_nowait(key)
+
+        async def worker(client):
+            while True:
+                try:
+                    key = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self.send(client, key)
+
+        limits = httpx.Limits(max_connections=self.args.concurrency)
+        async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(self.args.concurrency)))
+            self.duration = time.perf_counter() - start
+
+    def report(self) -> dict:
+        stages = {}
+        for stage in STAGES + ("first_byte", "client"):
+            values = self.samples.get(stage)
+            if not values:
+                continue
+            stages[stage] = {
+                "count": len(values),
+                "mean_ms": sum(values) / len(values),
+                "p50_ms": percentile(values, 0.50),
+                "p95_ms": percentile(values, 0.95),
+                "p99_ms": percentile(values, 0.99),
+                # Stage time spent per second of wall clock, i.e. average concurrency of the stage
+                "busy": sum(values) / 1000 / self.duration if self.duration else 0.0,
+            }
+        return {
+            "requests": self.args.requests,
+            "completed": self.completed,
+            "errors": dict(self.errors),
+            "duration_s": self.duration,
+            "throughput_rps": self.completed / self.duration if self.duration else 0.0,
+            "keys": self.args.keys,
+            "distribution": self.args.distribution,
+            "concurrency": self.args.concurrency,
+            "stages": stages,
+        }
+
+
+def print_report(report: dict):
+    print(f"Requests:    {report['completed']}/{report['requests']} completed, errors: {report['errors'] or 0}")
+    print(f"Duration:    {report['duration_s']:.2f}s")
+    print(f"Throughput:  {report['throughput_rps']:.2f} requests/s")
+    print(f"Keys:        {report['keys']} ({report['distribution']}), concurrency {report['concurrency']}")
+    print()
+    print(f"{'stage':<12} {'count':>6} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'busy':>6}")
+    for stage, stats in report["stages"].items():
+        print(
+            f"{stage:<12} {stats['count']:>6} {stats['mean_ms']:>7.1f}ms {stats['p50_ms']:>7.1f}ms "
+            f"{stats['p95_ms']:>7.1f}ms {stats['p99_ms']:>7.1f}ms {stats['busy']:>6.2f}"
+        )
+
+
+def main():
+    args = parse_arguments()
+    if args.keys < 1 or args.requests < 1 or args.concurrency < 1:
+        print("--keys, --requests and --concurrency must be positive", file=sys.stderr)
+        sys.exit(1)
+    load_test = LoadTest(args)
+    asyncio.run(load_test.run())
+    report = load_test.report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Mock llama.cpp server for offline benchmarks of the session service.
+
+Implements the endpoints the service uses (/health, /props, /slots,
+/slots/{id}?action=restore|save, /tokenize and /v1/chat/completions with
+and without streaming) with configurable delays and no model. Each slot
+remembers how many prompt tokens of its session are cached, so prompt
+processing time depends on session reuse the way it does on a real server:
+only tokens beyond the cached prefix cost --prompt-ms-per-token.
+
+Usage:
+    python benchmarks/mock_backend.py [--port 8080] [--slots 4] [--restore-ms 50] [--save-ms 50]
+                                      [--prompt-ms-per-token 0.5] [--token-ms 20] [--tokens 16]
+                                      [--save-dir PATH] [--session-bytes N]
+
+Arguments:
+    --port                  - Port to listen on (default: 8080)
+    --slots                 - Number of slots reported by /props (default: 4)
+    --restore-ms            - Delay of a session restore (default: 50)
+    --save-ms               - Delay of a session save (default: 50)
+    --prompt-ms-per-token   - Prompt processing time per uncached token (default: 0.5)
+    --token-ms              - Generation time per token (default: 20)
+    --tokens                - Tokens generated per completion (default: 16)
+    --save-dir              - Write session files to this directory (like --slot-save-path)
+    --session-bytes         - Size of the session files written to --save-dir (default: 1000000)
+
+Then start the service against it, e.g. ORIGINAL_SERVER_URL=http://localhost:8080.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Mock llama.cpp server")
+    parser.add_argument("--port", type=int, default=8080,
+                        help="Port to listen on (default: 8080)")
+    parser.add_argument("--slots", type=int, default=4,
+                        help="Number of slots reported by /props (default: 4)")
+    parser.add_argument("--restore-ms", dest="restore_ms", type=float, default=50.0,
+                        help="Delay of a session restore (default: 50)")
+    parser.add_argument("--save-ms", dest="save_ms", type=float, default=50.0,
+                        help="Delay of a session save (default: 50)")
+    parser.add_argument("--prompt-ms-per-token", dest="prompt_ms_per_token", type=float, default=0.5,
+                        help="Prompt processing time per uncached token (default: 0.5)")
+    parser.add_argument("--token-ms", dest="token_ms", type=float, default=20.0,
+                        help="Generation time per token (default: 20)")
+    parser.add_argument("--tokens", type=int, default=16,
+                        help="Tokens generated per completion (default: 16)")
+    parser.add_argument("--save-dir", dest="save_dir", default=None,
+                        help="Write session files to this directory (like --slot-save-path)")
+    parser.add_argument("--session-bytes", dest="session_bytes", type=int, default=1000000,
+                        help="Size of the session files written to --save-dir (default: 1000000)")
+    return parser.parse_args()
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count, 4 characters per token."""
+    return max(1, len(text) // 4)
+
+
+def create_app(args) -> FastAPI:
+    app = FastAPI(title="Mock llama.cpp server")
+    # Cached prompt tokens per slot and per saved session file
+    slot_tokens = {slot_id: 0 for slot_id in range(args.slots)}
+    saved_tokens = {}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/props")
+    async def props():
+        return {"total_slots": args.slots}
+
+    @app.get("/slots")
+    async def slots():
+        return [{"id": slot_id, "n_past": n_past} for slot_id, n_past in slot_tokens.items()]
+
+    @app.post("/slots/{slot_id}")
+    async def slot_action(slot_id: int, action: str, request: Request):
+        body = await request.json()
+        filename = body.get("filename", "")
+        path = os.path.join(args.save_dir, filename) if args.save_dir else None
+
+        if action == "save":
+            await asyncio.sleep(args.save_ms / 1000)
+            saved_tokens[filename] = slot_tokens[slot_id]
+            if path:
+                with open(path, "wb") as f:
+                    f.write(b"\0" * args.session_bytes)
+            return {"id_slot": slot_id, "filename": filename, "n_saved": slot_tokens[slot_id],
+                    "n_written": args.session_bytes, "timings": {"save_ms": args.save_ms}}
+
+        if action == "restore":
+            exists = os.path.exists(path) if path else filename in saved_tokens
+            if not exists:
+                return JSONResponse({"error": {"code": 400, "message": "failed to restore slot"}},
+                                    status_code=400)
+            await asyncio.sleep(args.restore_ms / 1000)
+            slot_tokens[slot_id] = saved_tokens.get(filename, 0)
+            return {"id_slot": slot_id, "filename": filename, "n_restored": slot_tokens[slot_id],
+                    "n_read": args.session_bytes, "timings": {"restore_ms": args.restore_ms}}
+
+        return JSONResponse({"error": {"code": 400, "message": f"unknown action {action}"}},
+                            status_code=400)
+
+    @app.post("/tokenize")
+    async def tokenize(request: Request):
+        body = await request.json()
+        return {"tokens": list(range(count_tokens(body.get("content", ""))))}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        slot_id = body.get("id_slot", 0) % args.slots
+        prompt = json.dumps(body.get("messages", []))
+        prompt_tokens = count_tokens(prompt)
+        cached = min(slot_tokens[slot_id], prompt_tokens)
+        evaluated = prompt_tokens - cached
+        prompt_ms = evaluated * args.prompt_ms_per_token
+        slot_tokens[slot_id] = prompt_tokens + args.tokens
+        timings = {
+            "cache_n": cached,
+            "prompt_n": evaluated,
+            "prompt_ms": prompt_ms,
+            "prompt_per_second": evaluated / prompt_ms * 1000 if prompt_ms else 0.0,
+            "predicted_n": args.tokens,
+            "predicted_ms": args.tokens * args.token_ms,
+            "predicted_per_second": 1000 / args.token_ms if args.token_ms else 0.0,
+        }
+
+        if body.get("stream"):
+            async def generate():
+                await asyncio.sleep(prompt_ms / 1000)
+                for i in range(args.tokens):
+                    await asyncio.sleep(args.token_ms / 1000)
+                    chunk = {"choices": [{"index": 0, "delta": {"content": f" t{i}"}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "timings": timings}
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(generate(), media_type="text/event-stream")
+
+        await asyncio.sleep((prompt_ms + args.tokens * args.token_ms) / 1000)
+        content = " ".join(f"t{i}" for i in range(args.tokens))
+        return {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": args.tokens},
+            "timings": timings,
+        }
+
+    return app
+
+
+def main():
+    args = parse_arguments()
+    if args.save_dir:
+        os.makedirs(args.save_dir, exist_ok=True)
+    print(f"Mock llama.cpp server with {args.slots} slots on port {args.port}", file=sys.stderr)
+    uvicorn.run(create_app(args), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
 import httpx
 import os.path
 import sys
 import asyncio
 import logging
 import argparse
-import subprocess
 from pathlib import Path
 from mcp.server.fastmcp import FastMCP
 
@@ -22,22 +22,87 @@ logger = logging.getLogger('git_history')
 parser = argparse.ArgumentParser(description='Git history lookup tool')
 parser.add_argument('--base-url', type=str, default='http://localhost:8000',
                     help='Base URL for API endpoints (default: http://localhost:8000)')
+parser.add_argument('--git-timeout', type=float, default=10.0,
+                    help='Timeout for git commands in seconds (default: 10)')
+parser.add_argument('--max-concurrency', type=int, default=4,
+                    help='Tool calls sent to the service at the same time (default: 4)')
+parser.add_argument('--request-timeout', type=float, default=60.0,
+                    help='Timeout of a request to the service in seconds (default: 60)')
 parser.add_argument('--test', action='store_true', help='Run test function')
 parser.add_argument('--test-repo', type=str, help='Repository path for testing')
 parser.add_argument('--test-query', type=str, default='Explain the main functionality',
                     help='Query for testing')
 args, unknown = parser.parse_known_args()
 
-# Initialize FastMCP server
-mcp = FastMCP("history_lookup")
-
 BASE_URL = args.base_url
 
+# Limits on git processes spawned by tool calls
+GIT_TIMEOUT = args.git_timeout
+git_semaphore = asyncio.Semaphore(4)
+
+# Limits on tool calls waiting for the service
+call_semaphore = asyncio.Semaphore(args.max_concurrency)
+
+# Client shared by all tool calls, created on first use
+http_client: Optional[httpx.AsyncClient] = None
+
+# Repository path -> (mtime of .git, valid), so a path is only verified with git once per change
+repo_cache: Dict[str, Tuple[int, bool]] = {}
+
 logger.info(f"Configured with BASE_URL={BASE_URL}")
 
+
+def get_client() -> httpx.AsyncClient:
+    """Long-lived client, so connections to the service are reused across tool calls."""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = httpx.AsyncClient(
+            timeout=args.request_timeout,
+            limits=httpx.Limits(
+                max_connections=args.max_concurrency,
+                max_keepalive_connections=args.max_concurrency,
+            ),
+        )
+    return http_client
+
+
+async def close_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+
+@asynccontextmanager
+async def lifespan(server):
+    try:
+        yield
+    finally:
+        await close_client()
+
+
+# Initialize FastMCP server
+mcp = FastMCP("history_lookup", lifespan=lifespan)
+
+
+def repo_mtime(repo_path: str) -> Optional[int]:
+    """
+    Modification time of the repository's .git (or of the path itself for
+    subdirectories of a work tree), None if the path does not exist.
+    """
+    for path in (os.path.join(repo_path, ".git"), repo_path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+    return None
+
 async def verify_git_repo(repo_path: str) -> bool:
     """
     Verify that the path is a git repository.
+
+    Results are cached per path until the mtime of its .git changes, so
+    repeated calls for the same repository do not run git.
     
     Args:
         repo_path: Path to the git repository
@@ -45,11 +110,34 @@ async def verify_git_repo(repo_path: str) -> bool:
     Returns:
         True if valid git repository, False otherwise
     """
+    mtime = repo_mtime(repo_path)
+    if mtime is None:
+        return False
+    cached = repo_cache.get(repo_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    valid = await run_verify_git_repo(repo_path)
+    repo_cache[repo_path] = (mtime, valid)
+    return valid
+
+async def run_verify_git_repo(repo_path: str) -> bool:
+    """Run git to check that the path is inside a work tree."""
+    cmd = ["git", "-C", repo_path, "rev-parse", "--is-inside-work-tree"]
     try:
-        cmd = ["git", "-C", repo_path, "rev-parse", "--is-inside-work-tree"]
-        process = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return process.stdout.strip() == "true"
-    except subprocess.CalledProcessError:
+        async with git_semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, _ = await asyncio.wait_for(process.communicate(), GIT_TIMEOUT)
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+        return process.returncode == 0 and stdout.decode().strip() == "true"
+    except asyncio.TimeoutError:
+        logger.error(f"Timed out verifying git repository: {repo_path}")
         return False
     except Exception as e:
         logger.error(f"Error verifying git repository: {str(e)}")
@@ -88,30 +176,34 @@ async def history_lookup(repo_path: str, query: str, num_commits: int = 10) -> s
         
         logger.info(f"Sending request to: {url}")
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            response = await client.post(
+        headers = {
+            "Content-Type": "application/json"
+        }
+        
+        async with call_semaphore:
+            response = await get_client().post(
                 url,
                 json=history_request,
                 headers=headers
             )
+        
+        if response.status_code != 200:
+            error_msg = f"Error from git history service: {response.text}"
+            logger.error(error_msg)
+            return error_msg
+        
+        # Extract and return the content from the response
+        response_json = response.json()
+        if "choices" in response_json and len(response_json["choices"]) > 0:
+            if "message" in response_json["choices"][0] and "content" in response_json["choices"][0]["message"]:
+                return response_json["choices"][0]["message"]["content"]
             
-            if response.status_code != 200:
-                error_msg = f"Error from git history service: {response.text}"
-                logger.error(error_msg)
-                return error_msg
-            
-            # Extract and return the content from the response
-            response_json = response.json()
-            if "choices" in response_json and len(response_json["choices"]) > 0:
-                if "message" in response_json["choices"][0] and "content" in response_json["choices"][0]["message"]:
-                    return response_json["choices"][0]["message"]["content"]
-                
-            return f"Invalid response format from git history service: {response_json}"
+        return f"Invalid response format from git history service: {response_json}"
             
+    except asyncio.CancelledError:
+        # The connection is closed, so the service cancels the request and stops generating
+        logger.info(f"History lookup for {repo_path} cancelled")
+        raise
     except Exception as e:
         error_msg = f"Error during git history lookup: {str(e)}"
         logger.error(error_msg)
@@ -123,8 +215,11 @@ async def test_history_lookup():
         logger.error("Please provide a test repository path with --test-repo")
         return
     
-    result = await history_lookup(args.test_repo, args.test_query)
-    logger.info(f"Git history lookup for {args.test_repo}:\n{result}")
+    try:
+        result = await history_lookup(args.test_repo, args.test_query)
+        logger.info(f"Git history lookup for {args.test_repo}:\n{result}")
+    finally:
+        await close_client()
 
 if __name__ == "__main__":
     if args.test: